@@ -1,18 +1,21 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
 from typing import List, Optional
 import os
 import shutil
+import uuid
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
 import base64
+import asyncio
 
 from services.document_service import DocumentService
-from services.vector_service import VectorService
+from services.vector_service import create_vector_service, STATIC_NAMESPACE, vector_id
 from services.embedding_service import EmbeddingService
 from services.llm_service import LLMService
 from services.chat_protocol import (
@@ -27,19 +30,29 @@ from routes.health import router as health_router
 
 # Configure logging to use stdout instead of stderr
 import sys
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Log calls only enqueue records; a listener thread does the stdout writes so
+# logging never blocks the event loop
+stdout_handler = logging.StreamHandler(sys.stdout)
+stdout_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 )
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, stdout_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush queued records on shutdown
+
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 # Initialize services
 document_service = DocumentService()
-vector_service = VectorService()
+vector_service = create_vector_service()
 embedding_service = EmbeddingService()
 llm_service = LLMService()
 
@@ -88,6 +101,30 @@ class DirectQueryResponse(BaseModel):
     answer: str
 
 
+# Seconds to wait on the warm-up before giving up on it
+PREWARM_TIMEOUT = 5.0
+
+
+async def _prewarm():
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(llm_service.prewarm(), vector_service.prewarm()),
+            timeout=PREWARM_TIMEOUT,
+        )
+    except Exception as e:
+        logger.warning("Connection warm-up did not finish: %r", e)
+
+
+@app.on_event("startup")
+async def prewarm_connections():
+    """Open OpenRouter and Pinecone connections before the first user request
+
+    Best effort: it runs in the background so a slow upstream can't hold up
+    startup.
+    """
+    app.state.prewarm_task = asyncio.create_task(_prewarm())
+
+
 # Include routers
 app.include_router(documents_router)
 app.include_router(health_router)
@@ -106,6 +143,7 @@ async def upload_document(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Unsupported file type")
 
     file_path = None
+    document_id = None
     try:
         # Create uploads directory if it doesn't exist
         uploads_dir = Path("uploads")
@@ -116,33 +154,66 @@ async def upload_document(file: UploadFile = File(...)):
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
-        # Process document
-        result = await document_service.process_document(str(file_path), file.filename)
+        vectors_stored = 0
 
-        # Generate embeddings for chunks
-        chunk_texts = [chunk["text"] for chunk in result["chunks"]]
-        embeddings = await embedding_service.generate_embeddings(chunk_texts)
+        async def store_chunks(document: dict, chunks: List[dict]):
+            """Embed a batch of chunks and store the vectors in Pinecone"""
+            nonlocal vectors_stored
 
-        # Prepare vectors for Pinecone
-        vectors = []
-        for i, (chunk, embedding) in enumerate(zip(result["chunks"], embeddings)):
-            vectors.append(
+            embeddings = await embedding_service.generate_embeddings(
+                [chunk["text"] for chunk in chunks]
+            )
+
+            # Prepare vectors for Pinecone
+            vectors = [
                 {
-                    "id": f"{result['document_id']}_chunk_{i}",
+                    "id": vector_id(document["document_id"], chunk["chunk_index"]),
                     "values": embedding,
                     "metadata": {
-                        "document_id": result["document_id"],
-                        "filename": result["filename"],
-                        "chunk_index": i,
+                        "document_id": document["document_id"],
+                        "filename": document["filename"],
+                        "chunk_index": chunk["chunk_index"],
                         "text": chunk["text"],
                         "token_count": chunk["token_count"],
-                        "upload_date": result["upload_date"],
+                        "upload_date": document["upload_date"],
                     },
                 }
-            )
-
-        # Store vectors in Pinecone
-        upsert_result = await vector_service.upsert_vectors(vectors)
+                for chunk, embedding in zip(chunks, embeddings)
+            ]
+
+            # Store vectors in Pinecone
+            upsert_result = await vector_service.upsert_vectors(vectors)
+            if upsert_result.get("status") == "error":
+                raise RuntimeError(upsert_result["error"])
+            vectors_stored += upsert_result.get("vectors_upserted", 0)
+
+            # Mirror the chunks into the static query-tier namespace if enabled
+            if embedding_service.static_model:
+                static_embeddings = await embedding_service.generate_static_embeddings(
+                    [chunk["text"] for chunk in chunks]
+                )
+                for vector, static_embedding in zip(vectors, static_embeddings):
+                    vector["values"] = static_embedding
+                upsert_result = await vector_service.upsert_vectors(
+                    vectors, namespace=STATIC_NAMESPACE
+                )
+                if upsert_result.get("status") == "error":
+                    raise RuntimeError(upsert_result["error"])
+
+        # Process document, embedding and storing chunks batch by batch. Hand
+        # over as many chunks as the vector service pipelines at once, so its
+        # upsert batches actually overlap. The id is fixed up front so a
+        # failed upload can remove the batches already stored
+        document_id = str(uuid.uuid4())
+        result = await document_service.process_document(
+            str(file_path),
+            file.filename,
+            store_chunks,
+            batch_size=vector_service.document_chunk_size,
+            document_id=document_id,
+        )
+        # Persist the document's vectors before it is listed as uploaded
+        await vector_service.flush()
 
         # Clean up temporary file
         os.remove(file_path)
@@ -152,12 +223,16 @@ async def upload_document(file: UploadFile = File(...)):
             "document_id": result["document_id"],
             "chunks_created": result["chunk_count"],
             "upload_date": result["upload_date"],
-            "vectors_stored": upsert_result.get("vectors_upserted", 0),
+            "vectors_stored": vectors_stored,
         }
     except Exception as e:
         # Clean up file if it exists
         if file_path and file_path.exists():
             os.remove(file_path)
+        # Drop any batches stored before the failure, so the document neither
+        # shows up half-indexed nor blocks a clean retry
+        if document_id:
+            await vector_service.delete_document_vectors(document_id)
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 
@@ -303,17 +378,21 @@ async def handle_chat_data(request: ChatRequest, protocol: str = Query("data")):
                     try:
                         logger.info(f"RAG Query: {query_text}")
                         # Generate embedding and search
-                        query_embedding = await embedding_service.generate_embedding(
-                            query_text
+                        query_embedding = (
+                            await embedding_service.generate_query_embedding(query_text)
                         )
                         similar_chunks = await vector_service.search_similar(
-                            query_embedding, top_k=10
+                            query_embedding,
+                            top_k=10,
+                            namespace=(
+                                STATIC_NAMESPACE if embedding_service.static_model else ""
+                            ),
                         )
 
                         # Sort by score descending (highest similarity first)
                         similar_chunks = sorted(
                             similar_chunks,
-                            key=lambda x: x.get("score", 0),
+                            key=lambda x: x.score,
                             reverse=True,
                         )
 
@@ -321,23 +400,23 @@ async def handle_chat_data(request: ChatRequest, protocol: str = Query("data")):
                             f"Found {len(similar_chunks)} similar chunks (sorted by score)"
                         )
                         for i, chunk in enumerate(similar_chunks):
-                            metadata = chunk.get("metadata", {})
+                            metadata = chunk.metadata
                             logger.info(
-                                f"Chunk {i+1}: score={chunk.get('score', 0):.4f}, filename={metadata.get('filename', 'unknown')}, text preview={metadata.get('text', '')[:100]}..."
+                                f"Chunk {i+1}: score={chunk.score:.4f}, filename={metadata.get('filename', 'unknown')}, text preview={metadata.get('text', '')[:100]}..."
                             )
 
                         # Add context to system message if we found relevant chunks
                         if similar_chunks:
                             # Prepare sources for the frontend
                             for i, chunk in enumerate(similar_chunks[:3]):
-                                metadata = chunk.get("metadata", {})
+                                metadata = chunk.metadata
                                 rag_sources.append(
                                     {
                                         "type": "document",
-                                        "id": chunk.get("id"),
+                                        "id": chunk.id,
                                         "filename": metadata.get("filename", "Unknown"),
                                         "chunk_index": metadata.get("chunk_index", 0),
-                                        "score": round(chunk.get("score", 0), 4),
+                                        "score": round(chunk.score, 4),
                                         "text": metadata.get("text", "")[
                                             :500
                                         ],  # Truncate for source display
@@ -346,7 +425,7 @@ async def handle_chat_data(request: ChatRequest, protocol: str = Query("data")):
 
                             context = "\n\n".join(
                                 [
-                                    chunk.get("metadata", {}).get("text", "")
+                                    chunk.metadata.get("text", "")
                                     for chunk in similar_chunks[:3]
                                 ]
                             )
@@ -390,7 +469,7 @@ async def handle_chat_data(request: ChatRequest, protocol: str = Query("data")):
             roles = [msg.get("role") for msg in openai_messages]
             logger.info(f"Message roles after truncation: {roles}")
 
-        response = StreamingResponse(
+        return EventSourceResponse(
             stream_text(
                 llm_service.client,
                 openai_messages,
@@ -398,18 +477,13 @@ async def handle_chat_data(request: ChatRequest, protocol: str = Query("data")):
                 0.7 if not request.use_rag else 0.1,
                 sources=rag_sources if rag_sources else None,
             ),
-            media_type="text/event-stream",
+            ping=15,  # Keep-alive comments during long generations
+            sep="\n",
+            headers={
+                "x-vercel-ai-data-stream": "v1",
+                "Cache-Control": "no-cache",
+            },
         )
-        response.headers["x-vercel-ai-data-stream"] = "v1"
-
-        # Required headers for SSE streaming
-        response.headers["Cache-Control"] = "no-cache"
-        response.headers["Connection"] = "keep-alive"
-        response.headers["X-Accel-Buffering"] = (
-            "no"  # Disable buffering in nginx/proxies
-        )
-
-        return response
 
     except Exception as e:
         logger.error(f"Error in streaming chat: {str(e)}")
@@ -1,14 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Dict, Any
+import logging
 
-from services.vector_service import VectorService
+from services.vector_service import create_vector_service
 from services.auth_service import require_permission
 
 router = APIRouter(prefix="/documents", tags=["documents"])
+logger = logging.getLogger(__name__)
 
 # Initialize service
-vector_service = VectorService()
+vector_service = create_vector_service()
 
 
 class Document(BaseModel):
@@ -40,9 +42,9 @@ async def list_documents():
             )
 
         return document_list
-    except Exception as e:
+    except Exception:
         # Return empty list if error occurs
-        print(f"Error listing documents: {e}")
+        logger.exception("Error listing documents")
         return []
 
 
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 import logging
 
-from services.vector_service import VectorService
+from services.vector_service import create_vector_service
 from services.embedding_service import EmbeddingService
 from services.llm_service import LLMService
 
@@ -9,7 +9,7 @@ router = APIRouter(tags=["health"])
 logger = logging.getLogger(__name__)
 
 # Initialize services
-vector_service = VectorService()
+vector_service = create_vector_service()
 embedding_service = EmbeddingService()
 llm_service = LLMService()
 
@@ -67,8 +67,7 @@ async def recreate_pinecone_index():
         index_name = vector_service.index_name
 
         # Delete existing index if it exists
-        existing_indexes = [index["name"] for index in vector_service.pc.list_indexes()]
-        if index_name in existing_indexes:
+        if vector_service.pc.has_index(index_name):
             vector_service.pc.delete_index(index_name)
             logger.info(f"Deleted existing index: {index_name}")
 
@@ -76,12 +75,13 @@ async def recreate_pinecone_index():
         vector_service.pc.create_index(
             name=index_name,
             dimension=768,
-            metric="cosine",
+            metric="dotproduct",  # Equals cosine on L2-normalized embeddings
             spec={"serverless": {"cloud": "aws", "region": "us-east-1"}},
         )
 
         # Reconnect to the new index
-        vector_service.index = vector_service.pc.Index(index_name)
+        vector_service.reset_index()
+        vector_service.registry.replace_all([])
 
         logger.info(f"Created new index: {index_name} with 768 dimensions")
         return {
@@ -6,6 +6,7 @@ https://ai-sdk.dev/docs/ai-sdk-ui/stream-protocol#data-stream-protocol
 
 import json
 import logging
+import uuid
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 import tiktoken
@@ -213,6 +214,36 @@ def _create_stream(client, model: str, messages: list, temperature: float):
         raise
 
 
+def _source_document_frames(sources: List[Dict[str, Any]]) -> List[str]:
+    """
+    Serialize RAG sources as source-document SSE payloads
+
+    Follows the AI SDK SourceDocumentUIPart structure; providerMetadata must be
+    Record<string, any> where values are JSON-serializable.
+    """
+    frames = []
+    for source in sources:
+        data = json.dumps(
+            {
+                "type": "source-document",
+                "sourceId": str(uuid.uuid4()),
+                "mediaType": "text/plain",
+                "title": f"{source.get('filename', 'Unknown')} - Chunk {source.get('chunk_index', 0) + 1}",
+                "filename": source.get("filename", "Unknown"),
+                "providerMetadata": {
+                    "rag": {
+                        "chunk_index": source.get("chunk_index", 0),
+                        "score": source.get("score", 0),
+                        "text": source.get("text", ""),
+                        "document_id": source.get("id", ""),
+                    }
+                },
+            }
+        )
+        frames.append(data)
+    return frames
+
+
 def stream_text(
     client,
     messages: List[Dict[str, Any]],
@@ -224,114 +255,120 @@ def stream_text(
     """
     Stream response from OpenRouter using AI SDK v5 SSE (Server-Sent Events) format
 
-    Yields Server-Sent Events formatted chunks:
-    - data: {"type":"message-start","messageId":"..."}
-    - data: {"type":"text-delta","delta":"text"}
-    - data: {"type":"finish-message","finishReason":"stop"}
-    - data: [DONE]
+    Yields the data payload of each Server-Sent Event; SSE framing is left to
+    EventSourceResponse:
+    - {"type":"text-start","id":"..."}
+    - {"type":"text-delta","id":"...","delta":"text"}
+    - {"type":"finish"}
+    - [DONE]
+
+    Source-document payloads are serialized here, before the generator is
+    returned, so the first event sent is not held up by source metadata.
 
     https://ai-sdk.dev/docs/ai-sdk-ui/stream-protocol
     """
-    import uuid
+    # When protocol is set to "text", send plain text chunks
+    if protocol == "text":
+        return _stream_plain_text(client, messages, model, temperature)
+
+    # Otherwise use AI SDK v5 SSE format
+    source_frames = _source_document_frames(sources) if sources else []
+    return _stream_data(client, messages, model, temperature, source_frames)
 
+
+def _stream_plain_text(
+    client, messages: List[Dict[str, Any]], model: str, temperature: float
+):
+    """Yield raw text deltas from the upstream stream
+
+    Streaming completions carry a single choice, so only the first one is read.
+    """
     stream = _create_stream(client, model, messages, temperature)
+    for chunk in stream:
+        choices = chunk.choices
+        if not choices:
+            continue
+        delta = choices[0].delta
+        if delta and delta.content:
+            yield delta.content
+
+
+def _stream_data(
+    client,
+    messages: List[Dict[str, Any]],
+    model: str,
+    temperature: float,
+    source_frames: List[str],
+):
+    """Yield AI SDK v5 data stream payloads from the upstream stream"""
+    stream = _create_stream(client, model, messages, temperature)
+    text_id = str(uuid.uuid4())
+    text_started = False
+    usage_data = None
+    finish_reason = None
+
+    try:
+        # Send source-document parts BEFORE text starts (if provided)
+        yield from source_frames
 
-    # When protocol is set to "text", send plain text chunks
-    if protocol == "text":
         for chunk in stream:
+            # Capture usage data from the final chunk (when include_usage is enabled)
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                usage_data = {
+                    "prompt_tokens": usage.prompt_tokens,
+                    "completion_tokens": usage.completion_tokens,
+                    "total_tokens": usage.total_tokens,
+                }
+
+            if not chunk.choices:
+                continue
+
             for choice in chunk.choices:
-                if choice.finish_reason == "stop":
-                    break
-                elif choice.delta and choice.delta.content:
-                    yield choice.delta.content
-
-    # When protocol is set to "data", use AI SDK v5 SSE format
-    elif protocol == "data":
-        text_id = str(uuid.uuid4())
-        text_started = False
-        usage_data = None
-
-        try:
-            # Send source-document parts BEFORE text starts (if provided)
-            # Following AI SDK SourceDocumentUIPart structure
-            # providerMetadata must be Record<string, any> where values are JSON-serializable
-            if sources:
-                for source in sources:
-                    source_id = str(uuid.uuid4())
-                    data = json.dumps(
+                delta = choice.delta
+                content = delta.content if delta else None
+
+                if content:
+                    # Send text-start on first content chunk
+                    if not text_started:
+                        yield json.dumps({"type": "text-start", "id": text_id})
+                        text_started = True
+
+                    # Send text deltas with the same id
+                    yield json.dumps(
                         {
-                            "type": "source-document",
-                            "sourceId": source_id,
-                            "mediaType": "text/plain",
-                            "title": f"{source.get('filename', 'Unknown')} - Chunk {source.get('chunk_index', 0) + 1}",
-                            "filename": source.get("filename", "Unknown"),
-                            "providerMetadata": {
-                                "rag": {
-                                    "chunk_index": source.get("chunk_index", 0),
-                                    "score": source.get("score", 0),
-                                    "text": source.get("text", ""),
-                                    "document_id": source.get("id", ""),
-                                }
-                            },
+                            "type": "text-delta",
+                            "id": text_id,
+                            "delta": content,
                         }
                     )
-                    yield f"data: {data}\n\n"
-
-            for chunk in stream:
-                # Capture usage data from the final chunk (when include_usage is enabled)
-                if hasattr(chunk, "usage") and chunk.usage is not None:
-                    usage_data = {
-                        "prompt_tokens": chunk.usage.prompt_tokens,
-                        "completion_tokens": chunk.usage.completion_tokens,
-                        "total_tokens": chunk.usage.total_tokens,
-                    }
-                    logger.info(f"Token usage: {usage_data}")
 
-                if not chunk.choices or len(chunk.choices) == 0:
-                    continue
+                # Capture finish reason
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
 
-                for choice in chunk.choices:
-                    # Send text-start on first content chunk
-                    if not text_started and choice.delta and choice.delta.content:
-                        data = json.dumps({"type": "text-start", "id": text_id})
-                        yield f"data: {data}\n\n"
-                        text_started = True
+        # Log once per stream rather than inside the per-chunk loop
+        if finish_reason:
+            logger.info("Stream finished with reason: %s", finish_reason)
+        if usage_data:
+            logger.info("Token usage: %s", usage_data)
 
-                    # Send text deltas with the same id
-                    if choice.delta and choice.delta.content:
-                        data = json.dumps(
-                            {
-                                "type": "text-delta",
-                                "id": text_id,
-                                "delta": choice.delta.content,
-                            }
-                        )
-                        yield f"data: {data}\n\n"
-
-                    # Capture finish reason
-                    if choice.finish_reason:
-                        finish_reason = choice.finish_reason
-                        logger.info(f"Stream finished with reason: {finish_reason}")
-
-            # Send text-end after all text deltas
-            if text_started:
-                data = json.dumps({"type": "text-end", "id": text_id})
-                yield f"data: {data}\n\n"
-
-            # Send usage data if available (before finish)
-            if usage_data and usage_data.get("prompt_tokens") is not None:
-                data = json.dumps({"type": "data-usage", "data": usage_data})
-                yield f"data: {data}\n\n"
-
-            # Send finish-message
-            data = json.dumps({"type": "finish"})
-            yield f"data: {data}\n\n"
-
-        except Exception as e:
-            logger.error(f"Error during streaming: {str(e)}")
-            # Send error message
-            yield f'data: {json.dumps({"type": "error", "error": str(e)})}\n\n'
-
-        finally:
-            # Always send [DONE] at the end to properly close the stream
-            yield "data: [DONE]\n\n"
+        # Send text-end after all text deltas
+        if text_started:
+            yield json.dumps({"type": "text-end", "id": text_id})
+
+        # Send usage data if available (before finish)
+        if usage_data and usage_data.get("prompt_tokens") is not None:
+            yield json.dumps({"type": "data-usage", "data": usage_data})
+
+        # Send finish-message
+        yield json.dumps({"type": "finish"})
+
+    except Exception as e:
+        logger.error(f"Error during streaming: {str(e)}")
+        # Send error message
+        yield json.dumps({"type": "error", "error": str(e)})
+
+    finally:
+        # Always send [DONE] at the end to properly close the stream
+        yield "[DONE]"
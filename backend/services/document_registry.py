@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+from typing import List, Dict, Any
+
+
+class DocumentRegistry:
+    """Local SQLite record of the documents stored in the vector database
+
+    Keeps one row per document so listing documents does not have to scan
+    every chunk vector in Pinecone. source names the vector store the rows
+    describe; opening the file for a different source empties it, so the
+    owning service rebuilds it from its own vectors instead of listing
+    documents it can neither search nor delete.
+    """
+
+    def __init__(self, path: str = "./documents.db", source: str = ""):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id TEXT PRIMARY KEY, filename TEXT NOT NULL, upload_date TEXT NOT NULL, "
+                "chunk_count INTEGER NOT NULL, total_tokens INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS registry_info ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            row = self.conn.execute(
+                "SELECT value FROM registry_info WHERE key = 'source'"
+            ).fetchone()
+            if row is None or row[0] != source:
+                self.conn.execute("DELETE FROM documents")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO registry_info (key, value) VALUES ('source', ?)",
+                    (source,),
+                )
+
+    def record_chunks(self, vectors: List[Dict[str, Any]]) -> None:
+        """Add the chunks in a batch of upserted vectors to their documents' totals"""
+        documents: Dict[str, Dict[str, Any]] = {}
+        for vec in vectors:
+            metadata = vec["metadata"]
+            doc_id = metadata.get("document_id")
+            if not doc_id:
+                continue
+
+            if doc_id not in documents:
+                documents[doc_id] = {
+                    "filename": metadata.get("filename", "Unknown"),
+                    "upload_date": metadata.get("upload_date", "Unknown"),
+                    "chunk_count": 0,
+                    "total_tokens": 0,
+                }
+            documents[doc_id]["chunk_count"] += 1
+            documents[doc_id]["total_tokens"] += metadata.get("token_count", 0)
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO documents (id, filename, upload_date, chunk_count, total_tokens) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "chunk_count = chunk_count + excluded.chunk_count, "
+                "total_tokens = total_tokens + excluded.total_tokens",
+                [
+                    (
+                        doc_id,
+                        doc["filename"],
+                        doc["upload_date"],
+                        doc["chunk_count"],
+                        doc["total_tokens"],
+                    )
+                    for doc_id, doc in documents.items()
+                ],
+            )
+
+    def replace_all(self, documents: List[Dict[str, Any]]) -> None:
+        """Replace the registry contents with the given document rows"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM documents")
+            self.conn.executemany(
+                "INSERT INTO documents (id, filename, upload_date, chunk_count, total_tokens) "
+                "VALUES (:id, :filename, :upload_date, :chunk_count, :total_tokens)",
+                documents,
+            )
+
+    def remove(self, document_id: str) -> None:
+        """Forget a deleted document"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def is_empty(self) -> bool:
+        """Whether no documents have been recorded yet"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """List all documents, newest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, filename, upload_date, chunk_count, total_tokens * 4 AS size "
+                "FROM documents ORDER BY upload_date DESC"
+            ).fetchall()
+
+        return [
+            {
+                "id": doc_id,
+                "filename": filename,
+                "upload_date": upload_date,
+                "size": size,  # Rough estimate: 4 bytes per token
+                "chunk_count": chunk_count,
+            }
+            for doc_id, filename, upload_date, chunk_count, size in rows
+        ]
@@ -1,12 +1,12 @@
 import uuid
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import List, Dict, Any, Callable, Awaitable, Iterator, Optional
+from datetime import date, datetime, time
 import PyPDF2
 from docx import Document
 import tiktoken
 import csv
-import openpyxl
 import io
+from python_calamine import CalamineWorkbook
 
 
 class DocumentService:
@@ -14,21 +14,41 @@ class DocumentService:
         self.upload_dir = upload_dir
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
-    async def process_document(self, file_path: str, filename: str) -> Dict[str, Any]:
-        """Process uploaded document and extract text"""
-        text = await self._extract_text(file_path, filename)
-        chunks = self._chunk_text(text)
-
-        document_id = str(uuid.uuid4())
-
-        return {
-            "document_id": document_id,
+    async def process_document(
+        self,
+        file_path: str,
+        filename: str,
+        store_chunks: Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[Any]],
+        batch_size: int = 64,
+        document_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Process uploaded document, handing chunks to store_chunks in batches
+
+        Chunks are produced lazily so only one batch of decoded chunk text is
+        held in memory at a time instead of the full chunk list. Callers that
+        need to clean up after a failed batch pass in the document_id.
+        """
+        document = {
+            "document_id": document_id or str(uuid.uuid4()),
             "filename": filename,
-            "chunks": chunks,
-            "chunk_count": len(chunks),
             "upload_date": datetime.now().isoformat(),
         }
 
+        chunk_count = 0
+        batch: List[Dict[str, Any]] = []
+        for chunk in self._iter_chunks(await self._extract_text(file_path, filename)):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                await store_chunks(document, batch)
+                chunk_count += len(batch)
+                batch = []
+
+        if batch:
+            await store_chunks(document, batch)
+            chunk_count += len(batch)
+
+        return {**document, "chunk_count": chunk_count}
+
     async def _extract_text(self, file_path: str, filename: str) -> str:
         """Extract text from different file formats"""
         if filename.endswith(".pdf"):
@@ -71,16 +91,34 @@ class DocumentService:
 
     def _extract_xlsx_text(self, file_path: str) -> str:
         """Extract text from XLSX file"""
-        text = []
-        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-        for sheet in workbook.worksheets:
-            text.append(f"Sheet: {sheet.title}")
-            for row in sheet.iter_rows(values_only=True):
-                # Filter out None values and convert to string
-                row_text = [str(cell) for cell in row if cell is not None]
+        return self._workbook_to_text(CalamineWorkbook.from_path(file_path))
+
+    def _workbook_to_text(self, workbook: CalamineWorkbook) -> str:
+        """Render every sheet of a workbook as comma separated lines"""
+        out = io.StringIO()
+        for sheet_name in workbook.sheet_names:
+            out.write(f"Sheet: {sheet_name}\n")
+            # iter_rows converts one row at a time rather than the whole sheet
+            for row in workbook.get_sheet_by_name(sheet_name).iter_rows():
+                # Calamine reports empty cells as "", skip them like missing cells
+                row_text = [
+                    self._cell_to_text(cell) for cell in row if cell is not None and cell != ""
+                ]
                 if row_text:
-                    text.append(", ".join(row_text))
-        return "\n".join(text)
+                    out.write(", ".join(row_text))
+                    out.write("\n")
+        return out.getvalue().rstrip("\n")
+
+    @staticmethod
+    def _cell_to_text(cell: Any) -> str:
+        """Render a calamine cell value the way openpyxl values printed"""
+        # Calamine reads every number as a float and date-formatted cells as
+        # dates, where openpyxl gave ints and datetimes
+        if isinstance(cell, float) and cell.is_integer():
+            return str(int(cell))
+        if isinstance(cell, date) and not isinstance(cell, datetime):
+            return str(datetime.combine(cell, time()))
+        return str(cell)
 
     async def extract_text_from_bytes(self, file_data: bytes, filename: str) -> str:
         """Extract text from file bytes (for in-memory processing)"""
@@ -104,16 +142,8 @@ class DocumentService:
             return "\n".join(lines)
 
         elif filename.endswith(".xlsx"):
-            xlsx_file = io.BytesIO(file_data)
-            workbook = openpyxl.load_workbook(xlsx_file, read_only=True, data_only=True)
-            text = []
-            for sheet in workbook.worksheets:
-                text.append(f"Sheet: {sheet.title}")
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = [str(cell) for cell in row if cell is not None]
-                    if row_text:
-                        text.append(", ".join(row_text))
-            return "\n".join(text)
+            workbook = CalamineWorkbook.from_filelike(io.BytesIO(file_data))
+            return self._workbook_to_text(workbook)
 
         elif filename.endswith(".docx"):
             docx_file = io.BytesIO(file_data)
@@ -123,18 +153,18 @@ class DocumentService:
         else:
             raise ValueError(f"Unsupported file type: {filename}")
 
-    def _chunk_text(
+    def _iter_chunks(
         self, text: str, chunk_size: int = 512, overlap: int = 50
-    ) -> List[Dict[str, Any]]:
-        """Split text into chunks with overlap"""
+    ) -> Iterator[Dict[str, Any]]:
+        """Split text into chunks with overlap, yielding them one at a time"""
         tokens = self.tokenizer.encode(text)
-        chunks = []
+        del text  # Only the tokens are needed from here on
 
-        for i in range(0, len(tokens), chunk_size - overlap):
+        for chunk_index, i in enumerate(range(0, len(tokens), chunk_size - overlap)):
             chunk_tokens = tokens[i : i + chunk_size]
-            chunk_text = self.tokenizer.decode(chunk_tokens)
-            chunks.append(
-                {"text": chunk_text, "start_index": i, "token_count": len(chunk_tokens)}
-            )
-
-        return chunks
+            yield {
+                "text": self.tokenizer.decode(chunk_tokens),
+                "chunk_index": chunk_index,
+                "start_index": i,
+                "token_count": len(chunk_tokens),
+            }
@@ -0,0 +1,74 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache stored in a local SQLite file
+
+    Entries are keyed on a hash of (model_id, text), so identical chunks and
+    repeated queries skip the encoder entirely. Vectors are stored as float16.
+    The connection is shared behind a lock, so calls may come from any thread.
+    """
+
+    def __init__(self, path: str = "./embedding_cache.db", ttl_seconds: int = 30 * 86400):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings_fp16 ("
+                "key BLOB PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "DELETE FROM embeddings_fp16 WHERE created_at < ?",
+                (time.time() - ttl_seconds,),
+            )
+
+    @staticmethod
+    def _key(text: str, model_id: str) -> bytes:
+        """Hash the text together with the model that embeds it"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(model_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def get_many(self, texts: List[str], model_id: str) -> List[Optional[np.ndarray]]:
+        """Return the cached embedding for each text, or None on a miss"""
+        keys = [self._key(text, model_id) for text in texts]
+        cutoff = time.time() - self.ttl_seconds
+        found = {}
+
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings_fp16 WHERE created_at >= ? "
+                    f"AND key IN ({','.join('?' * len(batch))})",
+                    (cutoff, *batch),
+                )
+                for key, vector in rows:
+                    found[key] = vector
+
+        return [
+            np.frombuffer(found[key], dtype=np.float16) if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, texts: List[str], model_id: str, embeddings: np.ndarray) -> None:
+        """Store embeddings for the given texts"""
+        now = time.time()
+        rows = [
+            (self._key(text, model_id), embedding.astype(np.float16).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings_fp16 (key, vector, created_at) VALUES (?, ?, ?)",
+                rows,
+            )
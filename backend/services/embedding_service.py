@@ -1,44 +1,239 @@
-from typing import List
-from sentence_transformers import SentenceTransformer
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+import torch
+from model2vec import StaticModel
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
 from dotenv import load_dotenv
 
+from services.embedding_cache import EmbeddingCache
+
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# INT8 model written by export_dynamic_quantized_onnx_model for the "avx512_vnni" config
+QUANTIZED_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# Single-text embedding requests are collected for up to this many seconds,
+# or until this many are queued, and then encoded as one batch
+MICRO_BATCH_WINDOW = 0.005
+MICRO_BATCH_MAX_SIZE = 32
+
+
+def cpu_supports_vnni() -> bool:
+    """Check whether the CPU has AVX-512 VNNI (INT8 dot products)"""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            return "avx512_vnni" in f.read()
+    except OSError:
+        return False
+
+
+def select_device() -> str:
+    """Pick the embedding device from EMBEDDING_DEVICE (auto|cpu|cuda|mps)"""
+    device = os.getenv("EMBEDDING_DEVICE", "auto").lower()
+    if device != "auto":
+        return device
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
 
 
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, batch_size: int = 32):
         # Use all-mpnet-base-v2 for better semantic search quality
         # all-mpnet-base-v2: 768 dim, ~420MB - best quality for general use
         # Provides significantly better retrieval accuracy than smaller models
         self.model_id = "sentence-transformers/all-mpnet-base-v2"
+        self.batch_size = batch_size
+        self.dimension = 768
+        self.device = select_device()
+        # Which runtime/precision encodes on that device, set by _load_model
+        self.variant = "torch"
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self.cache_dir = Path(os.getenv("EMBEDDING_CACHE_DIR", "./models")) / (
+            self.model_id.split("/")[-1]
+        )
+        self.cache = EmbeddingCache(
+            os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+        )
         try:
             # Load the model locally for better performance and reliability
-            self.model = SentenceTransformer(self.model_id)
-            print(f"Successfully loaded embedding model: {self.model_id}")
-        except Exception as e:
-            print(f"Error loading sentence transformer model: {e}")
+            self.model = self._load_model()
+            logger.info(
+                "Loaded embedding model %s on %s (%s)", self.model_id, self.device, self.variant
+            )
+        except Exception:
+            logger.exception("Error loading sentence transformer model")
             self.model = None
+        # INT8 ONNX, FP32 and FP16 vectors differ slightly, cache them apart so
+        # one index never mixes vectors from different encoders
+        self.cache_model_id = f"{self.model_id}:{self.device}:{self.variant}"
+
+        # Optional model2vec static model for low-latency query embeddings,
+        # e.g. STATIC_EMBEDDING_MODEL=minishlab/potion-base-8M
+        self.static_model_id = os.getenv("STATIC_EMBEDDING_MODEL")
+        self.static_model = None
+        if self.static_model_id:
+            try:
+                self.static_model = StaticModel.from_pretrained(self.static_model_id)
+                logger.info("Loaded static embedding model %s", self.static_model_id)
+            except Exception:
+                logger.exception("Error loading static embedding model")
+
+    def _load_model(self) -> SentenceTransformer:
+        """Load the encoder on the GPU if available, else on CPU
+
+        On CPU an INT8 ONNX Runtime model is preferred when the CPU has VNNI.
+        """
+        if self.device != "cpu":
+            model = SentenceTransformer(self.model_id, device=self.device)
+            # FP16 matmuls on CUDA; MPS stays FP32 as some FP16 ops lose accuracy
+            if self.device == "cuda":
+                model.half()
+                self.variant = "torch-fp16"
+            return model
+
+        # Without VNNI, INT8 matmuls are often slower than FP32, so stay on PyTorch
+        if not cpu_supports_vnni():
+            return SentenceTransformer(self.model_id, device="cpu")
+
+        # Quantize once and reuse the exported model on subsequent boots
+        if not (self.cache_dir / QUANTIZED_ONNX_FILE).exists():
+            model = SentenceTransformer(self.model_id, backend="onnx")
+            model.save(str(self.cache_dir))
+            export_dynamic_quantized_onnx_model(model, "avx512_vnni", str(self.cache_dir))
+            logger.info("Exported INT8 ONNX embedding model to %s", self.cache_dir)
+
+        self.variant = "onnx-int8"
+        return SentenceTransformer(
+            str(self.cache_dir),
+            backend="onnx",
+            model_kwargs={"file_name": QUANTIZED_ONNX_FILE},
+        )
 
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts"""
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate float16 embeddings for a list of texts, reusing cached vectors
+
+        Returns a (len(texts), dimension) array; convert to lists only at the
+        vector database boundary.
+        """
         if not self.model:
-            raise Exception("Sentence transformer model not loaded")
+            raise RuntimeError("Sentence transformer model not loaded")
 
         try:
-            # Generate embeddings for all texts at once (more efficient)
-            embeddings = self.model.encode(texts)
-            return [embedding.tolist() for embedding in embeddings]
-        except Exception as e:
-            raise Exception(f"Error generating embeddings: {str(e)}")
-
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text"""
-        if not self.model:
-            raise Exception("Sentence transformer model not loaded")
+            # Hashing and SQLite I/O for up to a whole upload batch, keep it
+            # off the event loop like the encode itself
+            cached = await asyncio.to_thread(
+                self.cache.get_many, texts, self.cache_model_id
+            )
+            embeddings = np.empty((len(texts), self.dimension), dtype=np.float16)
+            misses = []
+            for i, embedding in enumerate(cached):
+                if embedding is None:
+                    misses.append(i)
+                else:
+                    embeddings[i] = embedding
+
+            if misses:
+                # Encode all uncached texts in one batched call, off the event
+                # loop so concurrent requests keep being served
+                miss_texts = [texts[i] for i in misses]
+                computed = (
+                    await asyncio.to_thread(
+                        self.model.encode,
+                        miss_texts,
+                        batch_size=self.batch_size,
+                        convert_to_numpy=True,
+                        normalize_embeddings=True,
+                        show_progress_bar=False,
+                    )
+                ).astype(np.float16)
+                await asyncio.to_thread(
+                    self.cache.put_many, miss_texts, self.cache_model_id, computed
+                )
+                embeddings[misses] = computed
+
+            return embeddings
+        except Exception:
+            logger.exception("Error generating embeddings")
+            raise
+
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text
+
+        Concurrent single-text calls are coalesced into one batched encode.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._batcher is None
+            or self._batcher.done()
+            or self._batcher.get_loop() is not loop
+        ):
+            self._queue = asyncio.Queue()
+            self._batcher = loop.create_task(self._run_batcher())
+
+        future: "asyncio.Future[np.ndarray]" = loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run_batcher(self):
+        """Drain queued single-text requests every few ms and embed them together"""
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + MICRO_BATCH_WINDOW
+            while len(items) < MICRO_BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                embeddings = await self.generate_embeddings([text for text, _ in items])
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(items, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    async def generate_static_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate static (model2vec) embeddings padded to the index dimension
+
+        Zero padding leaves cosine similarity unchanged, so static vectors can
+        live in their own namespace of the same Pinecone index.
+        """
+        if not self.static_model:
+            raise RuntimeError("Static embedding model not loaded")
 
         try:
-            # Generate embedding for single text
-            embedding = self.model.encode([text])
-            return embedding[0].tolist()  # Return as list of floats
-        except Exception as e:
-            raise Exception(f"Error generating embedding: {str(e)}")
+            # Token lookup + mean pool only, cheap enough to run inline
+            embeddings = self.static_model.encode(texts)
+            padded = np.zeros((len(texts), self.dimension), dtype=np.float32)
+            padded[:, : embeddings.shape[1]] = embeddings
+            # L2-normalize so dot-product scores match cosine similarity
+            padded /= np.linalg.norm(padded, axis=1, keepdims=True) + 1e-12
+            return padded.astype(np.float16)
+        except Exception:
+            logger.exception("Error generating static embeddings")
+            raise
+
+    async def generate_query_embedding(self, text: str) -> np.ndarray:
+        """Embed a search query, using the static model when it is enabled"""
+        if self.static_model:
+            embeddings = await self.generate_static_embeddings([text])
+            return embeddings[0]
+        return await self.generate_embedding(text)
@@ -0,0 +1,95 @@
+import logging
+import os
+from typing import List
+import numpy as np
+from usearch.index import Index
+
+from services.local_vector_service import KeyedNamespaceStore, LocalVectorService, atomic_write
+from services.vector_service import Match
+
+logger = logging.getLogger(__name__)
+
+# usearch scalar kinds for the LOCAL_VECTOR_DTYPE settings
+USEARCH_DTYPES = {"float32": "f32", "int8": "i8"}
+
+
+class HNSWNamespaceStore(KeyedNamespaceStore):
+    """Vectors of one namespace in a usearch HNSW graph
+
+    Search is approximate and sub-linear in the number of vectors. Vectors
+    are normalized, so float32 indexes score by inner product. String
+    vector ids are mapped to the integer keys usearch requires.
+    """
+
+    dtypes = tuple(USEARCH_DTYPES)
+
+    def __init__(self, dimension: int, dtype: str = "float32"):
+        super().__init__(dimension)
+        self.index = Index(
+            ndim=dimension,
+            # Vectors are normalized on the way in, so inner product is cosine;
+            # i8 codes drop the scale, which only cosine is invariant to
+            metric="cos" if dtype == "int8" else "ip",
+            dtype=USEARCH_DTYPES[dtype],
+            connectivity=16,
+            expansion_add=128,
+        )
+        # Set while the index is memory-mapped from disk, which is read-only
+        self.view_path = None
+
+    def _make_writable(self):
+        if self.view_path:
+            self.index.load(self.view_path)
+            self.view_path = None
+
+    def _add_keys(self, keys: np.ndarray, values: np.ndarray) -> None:
+        self._make_writable()
+        self.index.add(keys.astype(np.uint64), values, threads=os.cpu_count() or 0)
+
+    def _remove_keys(self, keys: List[int]) -> None:
+        self._make_writable()
+        self.index.remove(np.array(keys, dtype=np.uint64))
+
+    def search(self, queries: np.ndarray, top_k: int) -> List[List[Match]]:
+        if not self.ids:
+            return [[] for _ in queries]
+
+        matches = self.index.search(queries, min(top_k, len(self.ids)))
+        # A single query comes back as Matches, several as BatchMatches
+        keys = np.atleast_2d(matches.keys)
+        distances = np.atleast_2d(matches.distances)
+        counts = np.atleast_1d(getattr(matches, "counts", keys.shape[1]))
+
+        return [
+            self._matches(row_keys[:count].tolist(), (1.0 - row_distances[:count]).tolist())
+            for row_keys, row_distances, count in zip(keys, distances, counts)
+        ]
+
+    def save(self, path: str):
+        # A still-mapped index is unchanged since it was loaded from this path
+        if self.view_path != path:
+            with atomic_write(path) as tmp_path:
+                self.index.save(tmp_path)
+        self.save_sidecar(f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str, dimension: int, dtype: str = "float32") -> "HNSWNamespaceStore":
+        store = cls(dimension, dtype)
+        store.load_sidecar(f"{path}.json")
+        # Memory-map the graph instead of reading it into RAM; it is only
+        # loaded fully once the store is first modified
+        store.index.view(path)
+        store.view_path = path
+        return store
+
+
+class HNSWVectorService(LocalVectorService):
+    """Embedded approximate search with usearch HNSW, for larger local corpora
+
+    Selected with VECTOR_BACKEND=hnsw. Indexes persist to LOCAL_VECTOR_DIR and
+    are memory-mapped on startup.
+    """
+
+    backend_name = "hnsw"
+    store_class = HNSWNamespaceStore
+    store_suffix = ".usearch"
@@ -0,0 +1,13 @@
+import httpx
+
+# LLM completions can stream for minutes, so reads get the OpenAI SDK's own
+# 600s default; connecting and writing should still fail fast
+TIMEOUT = httpx.Timeout(connect=5.0, read=600.0, write=30.0, pool=30.0)
+
+# Shared async HTTP client for outbound API calls. HTTP/2 multiplexes
+# concurrent requests over one pooled TLS connection per host.
+http_client = httpx.AsyncClient(timeout=TIMEOUT, http2=True)
+
+# Blocking counterpart for the synchronous OpenAI client used by the chat
+# stream, shared so its connections can be warmed up ahead of requests
+sync_http_client = httpx.Client(timeout=TIMEOUT, http2=True)
@@ -1,33 +1,139 @@
+import asyncio
+import logging
 import os
 import base64
-from typing import List, Dict, Any, Optional
+from string import Template
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Final, Tuple
+import aiofiles
 import openai
+import tiktoken
 from dotenv import load_dotenv
 
+from services.http_client import http_client, sync_http_client
+
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Static so providers with prompt caching can reuse it across requests; the
+# per-request context and question go in the user turn
+RAG_SYSTEM_PROMPT = """You are a helpful FDA regulatory assistant. A user will ask a question together with the relevant information from the knowledge base.
+
+Please provide a helpful, accurate response based on this information. Keep the response concise and informative. If you include information from the documents, make sure it's accurate to what's provided in the context."""
+
+RAG_USER_PROMPT = Template(
+    """Here is the relevant information from the knowledge base:
+
+$context
+
+The user's question is: $query"""
+)
+
+DIRECT_SYSTEM_PROMPT = """You are a helpful FDA regulatory assistant. You have general knowledge about FDA regulations, processes, and guidelines.
+
+Please provide helpful and accurate responses based on your training data. Be clear about the limitations of your knowledge and recommend consulting official FDA resources when appropriate."""
+
+# Prompt token budget for RAG requests (system prompt + context + query)
+CONTEXT_TOKEN_BUDGET = 3500
+
+# Close enough to most OpenRouter models' tokenizers; loaded once at import
+_context_encoder = tiktoken.encoding_for_model("gpt-4o-mini")
+_rag_prompt_tokens = len(_context_encoder.encode(RAG_SYSTEM_PROMPT)) + len(
+    _context_encoder.encode(RAG_USER_PROMPT.substitute(context="", query=""))
+)
+
+
+def fit_context_chunks(
+    query: str, context_chunks: List[str], budget: int = CONTEXT_TOKEN_BUDGET
+) -> List[str]:
+    """Take chunks in rank order until the prompt token budget is used up"""
+    used = _rag_prompt_tokens + len(_context_encoder.encode(query))
+    selected = []
+    for chunk in context_chunks:
+        used += len(_context_encoder.encode(chunk))
+        if used >= budget:
+            break
+        selected.append(chunk)
+    return selected
+
+
+def cached_system_message(prompt: str) -> Dict[str, Any]:
+    """System message marked for provider-side prompt caching
+
+    OpenRouter honors Anthropic-style cache_control breakpoints for models
+    that support prompt caching and ignores them elsewhere.
+    """
+    return {
+        "role": "system",
+        "content": [
+            {"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}
+        ],
+    }
+
+
+MIME_TYPES: Final[Dict[str, str]] = {
+    "pdf": "application/pdf",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "txt": "text/plain",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "doc": "application/msword",
+}
+
+# Multiple of 3 bytes so each chunk encodes without base64 padding
+BASE64_READ_SIZE = 57 * 1024
+
+
+async def encode_file_to_base64(file_path: str) -> str:
+    """Encode a file to base64 string, reading it in chunks"""
+    encoded = bytearray()
+    async with aiofiles.open(file_path, "rb") as file:
+        while chunk := await file.read(BASE64_READ_SIZE):
+            encoded.extend(base64.b64encode(chunk))
+    return encoded.decode("ascii")
+
+
+# LRU of base64-encoded attachments keyed by (path, mtime_ns, size), capped by
+# the total size of the encodings rather than the number of files
+ENCODED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Larger files are encoded on every use instead of crowding out the rest
+ENCODED_CACHE_MAX_FILE_BYTES = 8 * 1024 * 1024
+_encoded_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_encoded_cache_bytes = 0
 
 
-def encode_file_to_base64(file_path: str) -> str:
-    """Encode a file to base64 string"""
-    with open(file_path, "rb") as file:
-        return base64.b64encode(file.read()).decode("utf-8")
+async def get_encoded_file(file_path: str) -> str:
+    """Return a file's base64 encoding, reusing it while the file is unchanged"""
+    global _encoded_cache_bytes
+
+    stat = os.stat(file_path)
+    # A modified file gets a new mtime/size and therefore a fresh cache entry
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+
+    encoded = _encoded_cache.get(key)
+    if encoded is not None:
+        _encoded_cache.move_to_end(key)
+        return encoded
+
+    encoded = await encode_file_to_base64(file_path)
+    # A concurrent request may have cached the same file during the await
+    if len(encoded) > ENCODED_CACHE_MAX_FILE_BYTES or key in _encoded_cache:
+        return encoded
+
+    _encoded_cache[key] = encoded
+    _encoded_cache_bytes += len(encoded)
+    while _encoded_cache_bytes > ENCODED_CACHE_MAX_BYTES:
+        _, evicted = _encoded_cache.popitem(last=False)
+        _encoded_cache_bytes -= len(evicted)
+    return encoded
 
 
 def get_file_mime_type(filename: str) -> str:
     """Get MIME type based on file extension"""
-    ext = filename.lower().split(".")[-1]
-    mime_types = {
-        "pdf": "application/pdf",
-        "png": "image/png",
-        "jpg": "image/jpeg",
-        "jpeg": "image/jpeg",
-        "gif": "image/gif",
-        "webp": "image/webp",
-        "txt": "text/plain",
-        "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "doc": "application/msword",
-    }
-    return mime_types.get(ext, "application/octet-stream")
+    return MIME_TYPES.get(filename.rsplit(".", 1)[-1].lower(), "application/octet-stream")
 
 
 class LLMService:
@@ -37,10 +143,26 @@ class LLMService:
         self.model = "google/gemma-3-27b-it:free"
 
         if self.api_key:
-            self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+            self.client = openai.OpenAI(
+                api_key=self.api_key, base_url=self.base_url, http_client=sync_http_client
+            )
         else:
             self.client = None
 
+    async def prewarm(self) -> None:
+        """Open pooled connections to OpenRouter so the first completion skips DNS/TLS"""
+        if not self.api_key:
+            return
+
+        results = await asyncio.gather(
+            http_client.head(self.base_url),
+            asyncio.to_thread(sync_http_client.head, self.base_url),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("OpenRouter connection warm-up failed: %s", result)
+
     async def generate_rag_response(
         self,
         query: str,
@@ -52,51 +174,25 @@ class LLMService:
     ) -> str:
         """Generate RAG response using LLM with retrieved context and optional file attachments"""
         if not self.client:
-            raise Exception("OpenRouter API key not configured")
-
-        # Prepare context from chunks
-        context = "\n\n".join(context_chunks[:3])  # Use top 3 chunks
+            raise RuntimeError("OpenRouter API key not configured")
 
-        # Format sources for the response
-        sources_text = ""
-        if sources:
-            sources_text = "\n\n**Sources:**\n"
-            for i, source in enumerate(sources[:3]):
-                sources_text += f"{i + 1}. {source.get('filename', 'Unknown')} "
-                sources_text += f"(similarity: {(source.get('similarity_score', 0.0) * 100):.1f}%)\n"
-
-        # Build messages array
-        messages = []
-
-        # Add system prompt if enabled
-        if use_system_prompt:
-            system_prompt = f"""You are a helpful FDA regulatory assistant. A user has asked a question and here is the relevant information from the knowledge base:
-
-{context}
-
-Please provide a helpful, accurate response based on this information. Keep the response concise and informative. If you include information from the documents, make sure it's accurate to what's provided in the context.
-
-The user's question is: {query}"""
-            messages.append({"role": "system", "content": system_prompt})
+        sources_text = self._format_sources(sources)
 
         try:
-            # Use provided model or fallback to default
-            selected_model = model if model else self.model
-
-            # Build user message content (multimodal if files attached)
-            user_content = self._build_multimodal_content(query, attached_files)
-
-            # Add user message
-            messages.append({"role": "user", "content": user_content})  # type: ignore
+            messages = await self._build_rag_messages(
+                query, context_chunks, attached_files, use_system_prompt
+            )
 
             # Generate response using OpenRouter
             response = self.client.chat.completions.create(
-                model=selected_model,
+                model=model if model else self.model,
                 messages=messages,  # type: ignore
                 temperature=0.1,
                 max_tokens=500,
             )
 
+            self._report_cached_tokens(response)
+
             # Extract the response content
             llm_response = (
                 response.choices[0].message.content or "No response generated"
@@ -107,11 +203,55 @@ The user's question is: {query}"""
 
             return final_response
 
-        except Exception as e:
-            print(f"OpenRouter API Error: {str(e)}")
-            raise Exception(f"Error generating LLM response: {str(e)}")
+        except Exception:
+            logger.exception("OpenRouter API error")
+            raise
+
+    def _report_cached_tokens(self, response) -> None:
+        """Report how much of the prompt was served from the provider's cache"""
+        details = getattr(response.usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None)
+        if cached_tokens:
+            logger.info("Prompt cache hit: %s cached prompt tokens", cached_tokens)
+
+    def _format_sources(self, sources: List[Dict[str, Any]]) -> str:
+        """Format the top sources as a markdown footer"""
+        if not sources:
+            return ""
+        return "\n\n**Sources:**\n" + "".join(
+            [
+                f"{i + 1}. {source.get('filename', 'Unknown')} "
+                f"(similarity: {(source.get('similarity_score', 0.0) * 100):.1f}%)\n"
+                for i, source in enumerate(sources[:3])
+            ]
+        )
+
+    async def _build_rag_messages(
+        self,
+        query: str,
+        context_chunks: List[str],
+        attached_files: Optional[List[Dict[str, Any]]],
+        use_system_prompt: bool,
+    ) -> List[Dict[str, Any]]:
+        """Build the messages array for a RAG completion"""
+        messages: List[Dict[str, Any]] = []
+
+        # Add system prompt and knowledge base context if enabled
+        if use_system_prompt:
+            messages.append(cached_system_message(RAG_SYSTEM_PROMPT))
+            # Prepare context from as many top chunks as the token budget allows
+            context = "\n\n".join(fit_context_chunks(query, context_chunks))
+            prompt = RAG_USER_PROMPT.substitute(context=context, query=query)
+        else:
+            prompt = query
+
+        # Build user message content (multimodal if files attached)
+        user_content = await self._build_multimodal_content(prompt, attached_files)
+        messages.append({"role": "user", "content": user_content})
+
+        return messages
 
-    def _build_multimodal_content(
+    async def _build_multimodal_content(
         self, query: str, attached_files: Optional[List[Dict[str, Any]]] = None
     ):
         """Build multimodal content array for messages with text and files"""
@@ -122,19 +262,16 @@ The user's question is: {query}"""
         # Build content array with text and files
         content: List[Dict[str, Any]] = [{"type": "text", "text": query}]
 
-        for file_info in attached_files:
-            file_path = file_info.get("path")
-            filename = file_info.get("filename", "")
-
-            # Skip if file path is missing
-            if not file_path:
-                continue
+        # Skip files with a missing path, and encode the rest concurrently
+        files = [file_info for file_info in attached_files if file_info.get("path")]
+        encoded_files = await asyncio.gather(
+            *(get_encoded_file(file_info["path"]) for file_info in files)
+        )
 
+        for file_info, base64_data in zip(files, encoded_files):
+            filename = file_info.get("filename", "")
             mime_type = get_file_mime_type(filename)
 
-            # Encode file to base64
-            base64_data = encode_file_to_base64(file_path)
-
             # Handle different file types
             if mime_type.startswith("image/"):
                 # Image format for OpenRouter
@@ -179,36 +316,23 @@ The user's question is: {query}"""
     ) -> str:
         """Generate direct LLM response without RAG context"""
         if not self.client:
-            raise Exception("OpenRouter API key not configured")
-
-        # Build messages array
-        messages = []
-
-        # Add system prompt if enabled
-        if use_system_prompt:
-            system_prompt = """You are a helpful FDA regulatory assistant. You have general knowledge about FDA regulations, processes, and guidelines.
-
-Please provide helpful and accurate responses based on your training data. Be clear about the limitations of your knowledge and recommend consulting official FDA resources when appropriate."""
-            messages.append({"role": "system", "content": system_prompt})
+            raise RuntimeError("OpenRouter API key not configured")
 
         try:
-            # Use provided model or fallback to default
-            selected_model = model if model else self.model
-
-            # Build user message content (multimodal if files attached)
-            user_content = self._build_multimodal_content(query, attached_files)
-
-            # Add user message
-            messages.append({"role": "user", "content": user_content})  # type: ignore
+            messages = await self._build_direct_messages(
+                query, attached_files, use_system_prompt
+            )
 
             # Generate response using OpenRouter
             response = self.client.chat.completions.create(
-                model=selected_model,
+                model=model if model else self.model,
                 messages=messages,  # type: ignore
                 temperature=0.7,
                 max_tokens=500,
             )
 
+            self._report_cached_tokens(response)
+
             # Extract the response content
             llm_response = (
                 response.choices[0].message.content or "No response generated"
@@ -216,9 +340,28 @@ Please provide helpful and accurate responses based on your training data. Be cl
 
             return llm_response
 
-        except Exception as e:
-            print(f"OpenRouter API Error: {str(e)}")
-            raise Exception(f"Error generating LLM response: {str(e)}")
+        except Exception:
+            logger.exception("OpenRouter API error")
+            raise
+
+    async def _build_direct_messages(
+        self,
+        query: str,
+        attached_files: Optional[List[Dict[str, Any]]],
+        use_system_prompt: bool,
+    ) -> List[Dict[str, Any]]:
+        """Build the messages array for a direct completion"""
+        messages: List[Dict[str, Any]] = []
+
+        # Add system prompt if enabled
+        if use_system_prompt:
+            messages.append(cached_system_message(DIRECT_SYSTEM_PROMPT))
+
+        # Build user message content (multimodal if files attached)
+        user_content = await self._build_multimodal_content(query, attached_files)
+        messages.append({"role": "user", "content": user_content})
+
+        return messages
 
     async def test_connection(self) -> Dict[str, Any]:
         """Test the OpenRouter connection"""
@@ -239,5 +382,5 @@ Please provide helpful and accurate responses based on your training data. Be cl
                 "test_response": response.choices[0].message.content,
             }
         except Exception as e:
-            print(f"OpenRouter API Error in test_connection: {str(e)}")
+            logger.exception("OpenRouter API error in test_connection")
             return {"status": "error", "message": str(e)}
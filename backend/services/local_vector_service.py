@@ -0,0 +1,491 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Dict, Any, Set, Union
+import numpy as np
+from dotenv import load_dotenv
+
+from services.document_registry import DocumentRegistry
+from services.vector_service import STATIC_NAMESPACE, Match, normalize, vector_id_prefix
+
+try:
+    # SIMD int8 kernels, needed for the int8 store: without them every query
+    # would upcast the whole matrix. float32 scans use a BLAS matmul
+    import simsimd
+except ImportError:
+    simsimd = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def atomic_write(path: str):
+    """Yield a temporary path that replaces path once written
+
+    A crash mid-save leaves the previous file in place instead of a torn one.
+    """
+    tmp_path = f"{path}.tmp"
+    yield tmp_path
+    os.replace(tmp_path, path)
+
+
+class NamespaceStore:
+    """Vectors of one namespace held in a contiguous, pre-normalized matrix
+
+    With dtype int8 each vector is stored as int8 codes plus a float32 scale
+    (max |component| / 127), a quarter of the float32 footprint. int8 is
+    only offered when simsimd is installed to score the codes directly.
+    """
+
+    dtypes = ("float32", "int8") if simsimd is not None else ("float32",)
+
+    def __init__(self, dimension: int, dtype: str = "float32"):
+        if dtype not in self.dtypes:
+            raise ValueError(f"Unsupported vector dtype {dtype} (int8 requires simsimd)")
+        self.dimension = dimension
+        # Held by LocalVectorService around every operation on the store
+        self.lock = threading.Lock()
+        self.quantized = dtype == "int8"
+        self.matrix = np.empty((0, dimension), dtype=np.int8 if self.quantized else np.float32)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.size = 0
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+
+    def upsert(self, ids: List[str], values: np.ndarray, metadata: List[Dict[str, Any]]):
+        values = normalize(values)
+        if self.quantized:
+            scales = np.maximum(np.abs(values).max(axis=1), 1e-12) / 127
+            values = np.round(values / scales[:, None]).astype(np.int8)
+        else:
+            scales = np.ones(len(values), dtype=np.float32)
+
+        for vec_id, vector, scale, meta in zip(ids, values, scales, metadata):
+            row = self.rows.get(vec_id)
+            if row is None:
+                row = self.size
+                self._reserve(row + 1)
+                self.rows[vec_id] = row
+                self.ids.append(vec_id)
+                self.metadata.append(meta)
+                self.size += 1
+            else:
+                self.metadata[row] = meta
+            self.matrix[row] = vector
+            self.scales[row] = scale
+
+    def _reserve(self, rows: int):
+        # Grow geometrically so repeated upserts don't copy the matrix each time
+        if rows <= len(self.matrix):
+            return
+        capacity = max(rows, 2 * len(self.matrix), 1024)
+        matrix = np.empty((capacity, self.dimension), dtype=self.matrix.dtype)
+        matrix[: self.size] = self.matrix[: self.size]
+        scales = np.empty(capacity, dtype=np.float32)
+        scales[: self.size] = self.scales[: self.size]
+        self.matrix = matrix
+        self.scales = scales
+
+    def delete(self, prefixes: List[str]) -> None:
+        prefixes = tuple(prefixes)
+        keep = [i for i, vec_id in enumerate(self.ids) if not vec_id.startswith(prefixes)]
+        if len(keep) < self.size:
+            self.matrix = self.matrix[keep]
+            self.scales = self.scales[keep]
+            self.ids = [self.ids[i] for i in keep]
+            self.metadata = [self.metadata[i] for i in keep]
+            self.rows = {vec_id: i for i, vec_id in enumerate(self.ids)}
+            self.size = len(keep)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Similarity of every stored vector to each query, shape (queries, size)"""
+        matrix = self.matrix[: self.size]
+        if not self.quantized:
+            # Both sides are unit length, so a single BLAS matmul gives the
+            # cosine scores without recomputing any norms
+            return queries @ matrix.T
+
+        # simsimd's int8 kernels need int8 queries (int8 stores only exist when
+        # it is installed); the per-vector scale cancels out of the cosine
+        queries = np.round(
+            queries * 127 / np.abs(queries).max(axis=1, keepdims=True)
+        ).astype(np.int8)
+        return 1.0 - np.asarray(simsimd.cdist(queries, matrix, metric="cosine"))
+
+    def search(self, queries: np.ndarray, top_k: int) -> List[List[Match]]:
+        if self.size == 0:
+            return [[] for _ in queries]
+
+        scores = self.scores(queries)
+        k = min(top_k, self.size)
+        results = []
+        for row_scores in scores:
+            # Partial selection of the top k, then order just those
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append(
+                [Match(self.ids[i], float(row_scores[i]), self.metadata[i]) for i in top]
+            )
+        return results
+
+    def all_metadata(self) -> List[Dict[str, Any]]:
+        return self.metadata[: self.size]
+
+    def save(self, path: str):
+        # Ids as a fixed-width str array so loading never needs pickle
+        with atomic_write(path) as tmp_path, open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                matrix=self.matrix[: self.size],
+                scales=self.scales[: self.size],
+                ids=np.array(self.ids, dtype=str),
+                metadata=np.array(json.dumps(self.metadata)),
+            )
+
+    @classmethod
+    def load(cls, path: str, dimension: int, dtype: str = "float32") -> "NamespaceStore":
+        store = cls(dimension, dtype)
+        with np.load(path, allow_pickle=False) as data:
+            matrix = data["matrix"]
+            ids = data["ids"].tolist()
+            metadata = json.loads(str(data["metadata"]))
+            if matrix.dtype == store.matrix.dtype:
+                store.matrix = np.ascontiguousarray(matrix)
+                store.scales = (
+                    data["scales"] if "scales" in data else np.ones(len(ids), dtype=np.float32)
+                )
+                store.ids = ids
+                store.metadata = metadata
+                store.size = len(ids)
+                store.rows = {vec_id: i for i, vec_id in enumerate(ids)}
+                return store
+
+            # Saved with the other dtype, re-encode
+            vectors = matrix.astype(np.float32)
+            if "scales" in data:
+                vectors *= data["scales"][:, None]
+        if ids:
+            store.upsert(ids, vectors, metadata)
+        return store
+
+
+class KeyedNamespaceStore(ABC):
+    """Base for stores whose index addresses vectors by integer key
+
+    Maps string vector ids to the keys, keeps the metadata of each key and
+    saves both to a JSON sidecar. Subclasses add and remove keys in the
+    index itself and implement search.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        # Held by LocalVectorService around every operation on the store
+        self.lock = threading.Lock()
+        self.next_key = 0
+        self.keys: Dict[str, int] = {}
+        self.ids: Dict[int, str] = {}
+        self.metadata: Dict[int, Dict[str, Any]] = {}
+
+    @abstractmethod
+    def _add_keys(self, keys: np.ndarray, values: np.ndarray) -> None:
+        """Add normalized vectors to the index under the given keys"""
+
+    @abstractmethod
+    def _remove_keys(self, keys: List[int]) -> None:
+        """Remove the given keys from the index"""
+
+    def upsert(self, ids: List[str], values: np.ndarray, metadata: List[Dict[str, Any]]):
+        values = normalize(values)
+
+        # Re-upserted ids get fresh keys, the old entries are removed
+        replaced = [self.keys[vec_id] for vec_id in ids if vec_id in self.keys]
+        if replaced:
+            self._remove_keys(replaced)
+
+        keys = np.arange(self.next_key, self.next_key + len(ids), dtype=np.int64)
+        self.next_key += len(ids)
+        self._add_keys(keys, values)
+
+        for key, vec_id, meta in zip(keys.tolist(), ids, metadata):
+            old_key = self.keys.get(vec_id)
+            if old_key is not None:
+                del self.ids[old_key]
+                del self.metadata[old_key]
+            self.keys[vec_id] = key
+            self.ids[key] = vec_id
+            self.metadata[key] = meta
+
+    def delete(self, prefixes: List[str]) -> None:
+        prefixes = tuple(prefixes)
+        removed = [key for key, vec_id in self.ids.items() if vec_id.startswith(prefixes)]
+        if not removed:
+            return
+
+        self._remove_keys(removed)
+        for key in removed:
+            del self.keys[self.ids.pop(key)]
+            del self.metadata[key]
+
+    def _matches(self, keys: List[int], scores: List[float]) -> List[Match]:
+        # Keys the index returns without an entry (-1 padding, or a key whose
+        # id was upserted twice in one batch) are skipped
+        return [
+            Match(self.ids[key], float(score), self.metadata[key])
+            for key, score in zip(keys, scores)
+            if key in self.ids
+        ]
+
+    def all_metadata(self) -> List[Dict[str, Any]]:
+        return list(self.metadata.values())
+
+    def save_sidecar(self, path: str, **fields) -> None:
+        """Write the id mapping and metadata, plus any extra fields, as JSON"""
+        with atomic_write(path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    **fields,
+                    "next_key": self.next_key,
+                    "entries": [
+                        [key, vec_id, self.metadata[key]] for key, vec_id in self.ids.items()
+                    ],
+                },
+                f,
+            )
+
+    def load_sidecar(self, path: str) -> Dict[str, Any]:
+        """Restore the id mapping and metadata, returning the saved fields"""
+        with open(path) as f:
+            saved = json.load(f)
+        self.next_key = saved["next_key"]
+        for key, vec_id, meta in saved["entries"]:
+            self.keys[vec_id] = key
+            self.ids[key] = vec_id
+            self.metadata[key] = meta
+        return saved
+
+
+class LocalVectorService:
+    """In-process exact search, an alternative to Pinecone for small corpora
+
+    Selected with VECTOR_BACKEND=local. Vectors are kept in memory. Upserts
+    only mark their namespace changed; flush() writes changed namespaces to
+    LOCAL_VECTOR_DIR and only then records the chunks in the document
+    registry. The upload route flushes once per document, deletes are written
+    straight away, and anything left is flushed at exit.
+    """
+
+    backend_name = "local"
+    store_class = NamespaceStore
+    store_suffix = ".npz"
+    # Chunks the upload route hands over per upsert_vectors call
+    document_chunk_size = 1000
+
+    def __init__(self, dimension: int = 768):
+        self.dimension = dimension
+        self.data_dir = os.getenv("LOCAL_VECTOR_DIR", "./vector_store")
+        # int8 quarters memory and bandwidth of the scan at a small recall cost
+        self.dtype = os.getenv("LOCAL_VECTOR_DTYPE", "float32").lower()
+        if self.dtype not in self.store_class.dtypes:
+            logger.warning("Unsupported LOCAL_VECTOR_DTYPE %r, using float32", self.dtype)
+            self.dtype = "float32"
+        self.registry = DocumentRegistry(
+            os.getenv("DOCUMENT_REGISTRY_PATH", "./documents.db"),
+            source=f"{self.backend_name}:{os.path.abspath(self.data_dir)}",
+        )
+        # Pinecone-only attributes, kept so admin routes can report the backend
+        self.pc = None
+        self.index_name = None
+
+        self.namespaces = [""]
+        if os.getenv("STATIC_EMBEDDING_MODEL"):
+            self.namespaces.append(STATIC_NAMESPACE)
+
+        self.stores: Dict[str, Any] = {}
+        # Namespaces changed since they were last written, and the upserted
+        # chunks the registry hasn't counted yet. Both only change under the
+        # lock of the store they belong to
+        self.dirty: Set[str] = set()
+        self.pending_chunks: List[Dict[str, Any]] = []
+        for namespace in self.namespaces:
+            path = self._store_path(namespace)
+            try:
+                if os.path.exists(path):
+                    self._add_store(
+                        namespace, self.store_class.load(path, dimension, self.dtype)
+                    )
+            except Exception:
+                logger.exception("Failed to load local vectors from %s", path)
+
+        if self.registry.is_empty():
+            self.rebuild_registry()
+        atexit.register(self._flush)
+
+    def _store_path(self, namespace: str) -> str:
+        return os.path.join(self.data_dir, f"{namespace or 'default'}{self.store_suffix}")
+
+    def _add_store(self, namespace: str, store) -> None:
+        self.stores[namespace] = store
+
+    def _store(self, namespace: str):
+        if namespace not in self.stores:
+            self._add_store(namespace, self.store_class(self.dimension, self.dtype))
+        return self.stores[namespace]
+
+    def _save_store(self, namespace: str) -> None:
+        # Callers hold the store's lock
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.stores[namespace].save(self._store_path(namespace))
+        self.dirty.discard(namespace)
+
+    def _flush(self) -> None:
+        pending: List[Dict[str, Any]] = []
+        for namespace, store in list(self.stores.items()):
+            with store.lock:
+                if namespace in self.dirty:
+                    self._save_store(namespace)
+                if namespace == "":
+                    pending, self.pending_chunks = self.pending_chunks, []
+
+        # Only count chunks once their vectors are on disk, so a crash can't
+        # leave documents listed whose vectors were never written
+        if pending:
+            self.registry.record_chunks(pending)
+
+    async def flush(self) -> None:
+        """Write changed namespaces to LOCAL_VECTOR_DIR, then register their chunks
+
+        Rewriting a namespace costs its full size, so this runs once per
+        uploaded document rather than per upsert batch.
+        """
+        await asyncio.to_thread(self._flush)
+
+    @staticmethod
+    async def _locked(store, func, *args):
+        """Run func(*args) in a worker thread while holding the store's lock
+
+        Keeps index builds, scans and saves off the event loop, and keeps a
+        search from reading the index while an upsert is changing it.
+        """
+
+        def run():
+            with store.lock:
+                return func(*args)
+
+        return await asyncio.to_thread(run)
+
+    async def prewarm(self) -> None:
+        """Nothing to connect to"""
+
+    async def upsert_vectors(
+        self, vectors: List[Dict[str, Any]], namespace: str = ""
+    ) -> Dict[str, Any]:
+        """Insert or update vectors in the local store, each with an id, values and metadata"""
+        if not vectors:
+            return {"vectors_upserted": 0, "status": "success"}
+
+        store = self._store(namespace)
+
+        def upsert():
+            store.upsert(
+                [vec["id"] for vec in vectors],
+                np.stack([np.asarray(vec["values"]) for vec in vectors]),
+                [vec["metadata"] for vec in vectors],
+            )
+            self.dirty.add(namespace)
+            # Other namespaces hold copies of the same chunks, only count them once
+            if namespace == "":
+                self.pending_chunks.extend({"metadata": vec["metadata"]} for vec in vectors)
+
+        try:
+            await self._locked(store, upsert)
+            return {"vectors_upserted": len(vectors), "status": "success"}
+        except Exception as e:
+            logger.exception("Failed to upsert vectors")
+            return {"error": f"Failed to upsert vectors: {str(e)}", "status": "error"}
+
+    async def search_similar(
+        self,
+        query_embedding: Union[List[float], np.ndarray],
+        top_k: int = 5,
+        namespace: str = "",
+    ) -> List[Match]:
+        """Search for similar vectors"""
+        results = await self.search_similar_batch([query_embedding], top_k, namespace)
+        return results[0]
+
+    async def search_similar_batch(
+        self,
+        query_embeddings: Union[List[List[float]], np.ndarray],
+        top_k: int = 5,
+        namespace: str = "",
+    ) -> List[List[Match]]:
+        """Search for several query vectors at once, one result list per query"""
+        store = self.stores.get(namespace)
+        if store is None:
+            return [[] for _ in query_embeddings]
+
+        queries = normalize(query_embeddings)
+        try:
+            return await self._locked(store, store.search, queries, top_k)
+        except Exception:
+            logger.exception("Error searching vectors")
+            return [[] for _ in query_embeddings]
+
+    def _delete_from_store(
+        self, namespace: str, document_id: str, prefixes: List[str]
+    ) -> None:
+        self.stores[namespace].delete(prefixes)
+        self._save_store(namespace)
+        if namespace == "":
+            # Chunks of a failed upload may not have reached the registry yet
+            self.pending_chunks = [
+                chunk
+                for chunk in self.pending_chunks
+                if chunk["metadata"].get("document_id") != document_id
+            ]
+
+    async def delete_document_vectors(self, document_id: str) -> Dict[str, Any]:
+        """Delete all vectors for a document"""
+        try:
+            prefixes = [
+                vector_id_prefix(document_id),
+                f"{document_id}_chunk_",  # Ids written before the "#" format
+            ]
+            for namespace, store in self.stores.items():
+                await self._locked(
+                    store, self._delete_from_store, namespace, document_id, prefixes
+                )
+            self.registry.remove(document_id)
+            return {"document_id": document_id, "status": "deleted"}
+        except Exception as e:
+            logger.exception("Failed to delete vectors for document %s", document_id)
+            return {"document_id": document_id, "status": "error", "error": str(e)}
+
+    async def list_documents(self) -> List[Dict[str, Any]]:
+        """List all unique documents in the local store"""
+        try:
+            return self.registry.list_documents()
+        except Exception:
+            logger.exception("Error listing documents")
+            return []
+
+    def rebuild_registry(self) -> None:
+        """Rebuild the document registry from the stored chunk metadata"""
+        store = self.stores.get("")
+        if store is None:
+            return
+
+        try:
+            self.registry.replace_all([])
+            self.registry.record_chunks(
+                [{"metadata": metadata} for metadata in store.all_metadata()]
+            )
+        except Exception:
+            logger.exception("Error rebuilding document registry")
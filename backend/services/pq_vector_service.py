@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+from typing import List, Dict, Any, Callable, Optional
+import faiss
+import numpy as np
+
+from services.local_vector_service import (
+    KeyedNamespaceStore,
+    LocalVectorService,
+    NamespaceStore,
+    atomic_write,
+)
+from services.vector_service import Match
+
+logger = logging.getLogger(__name__)
+
+# 768-d vectors split into 96 sub-vectors of 8 dimensions, each coded in 8 bits:
+# 96 bytes per vector instead of 3 KB of float32
+PQ_SUBQUANTIZERS = 96
+PQ_BITS = 8
+
+# Vectors are kept exact until this many have arrived to train the codebooks on
+PQ_TRAIN_SIZE = 10_000
+
+
+class PQNamespaceStore(KeyedNamespaceStore):
+    """Vectors of one namespace product-quantized with a faiss IndexPQ
+
+    Until PQ_TRAIN_SIZE vectors have been upserted they are held exactly in a
+    NamespaceStore; the codebooks are then trained on them and every vector
+    from there on is stored as PQ codes and scored with lookup tables.
+    Training runs in a background thread while the exact store keeps serving.
+    """
+
+    dtypes = ("float32",)
+
+    def __init__(self, dimension: int, dtype: str = "float32"):
+        if dtype not in self.dtypes:
+            raise ValueError(f"PQ stores hold float32 vectors, not {dtype}")
+        super().__init__(dimension)
+        self.raw = NamespaceStore(dimension)
+        self.index = None
+        self.trainer = None
+        # Called under the lock once trained codes replace the exact vectors,
+        # so they reach disk without waiting for the next upsert
+        self.on_trained: Optional[Callable[[], None]] = None
+
+    def _start_training(self):
+        # Train on a snapshot so upserts and searches can go on under the lock
+        vectors = self.raw.matrix[: self.raw.size].copy()
+        self.trainer = threading.Thread(target=self._train, args=(vectors,), daemon=True)
+        self.trainer.start()
+
+    def _train(self, vectors: np.ndarray):
+        try:
+            pq = faiss.IndexPQ(
+                self.dimension, PQ_SUBQUANTIZERS, PQ_BITS, faiss.METRIC_INNER_PRODUCT
+            )
+            pq.train(vectors)
+            logger.info("Trained PQ codebooks on %d vectors", len(vectors))
+        except Exception:
+            logger.exception("Failed to train PQ codebooks")
+            self.trainer = None
+            return
+
+        # Encode whatever the exact store holds by now, including vectors
+        # upserted or deleted while training ran
+        with self.lock:
+            raw = self.raw
+            self.index = faiss.IndexIDMap2(pq)
+            self.raw = None
+            super().upsert(raw.ids, raw.matrix[: raw.size], raw.metadata)
+            if self.on_trained is not None:
+                try:
+                    self.on_trained()
+                except Exception:
+                    logger.exception("Failed to save trained PQ store")
+
+    def _add_keys(self, keys: np.ndarray, values: np.ndarray) -> None:
+        self.index.add_with_ids(values, keys)
+
+    def _remove_keys(self, keys: List[int]) -> None:
+        self.index.remove_ids(np.array(keys, dtype=np.int64))
+
+    def upsert(self, ids: List[str], values: np.ndarray, metadata: List[Dict[str, Any]]):
+        if self.index is not None:
+            super().upsert(ids, values, metadata)
+            return
+
+        self.raw.upsert(ids, values, metadata)
+        if self.raw.size >= PQ_TRAIN_SIZE and self.trainer is None:
+            self._start_training()
+
+    def delete(self, prefixes: List[str]) -> None:
+        if self.index is None:
+            self.raw.delete(prefixes)
+        else:
+            super().delete(prefixes)
+
+    def search(self, queries: np.ndarray, top_k: int) -> List[List[Match]]:
+        if self.index is None:
+            return self.raw.search(queries, top_k)
+        if not self.ids:
+            return [[] for _ in queries]
+
+        scores, keys = self.index.search(queries, min(top_k, len(self.ids)))
+        return [
+            self._matches(row_keys, row_scores)
+            for row_keys, row_scores in zip(keys.tolist(), scores.tolist())
+        ]
+
+    def all_metadata(self) -> List[Dict[str, Any]]:
+        if self.index is None:
+            return self.raw.all_metadata()
+        return super().all_metadata()
+
+    def save(self, path: str):
+        # path holds a manifest; the vectors go next to it, exact or as PQ codes
+        if self.index is None:
+            self.raw.save(f"{path}.npz")
+            self.save_sidecar(path, trained=False)
+            return
+
+        with atomic_write(f"{path}.faiss") as tmp_path:
+            faiss.write_index(self.index, tmp_path)
+        self.save_sidecar(path, trained=True)
+        # The manifest now points at the codes, drop the exact float32 copy
+        if os.path.exists(f"{path}.npz"):
+            os.remove(f"{path}.npz")
+
+    @classmethod
+    def load(cls, path: str, dimension: int, dtype: str = "float32") -> "PQNamespaceStore":
+        store = cls(dimension, dtype)
+        if not store.load_sidecar(path)["trained"]:
+            store.raw = NamespaceStore.load(f"{path}.npz", dimension)
+            return store
+
+        store.raw = None
+        store.index = faiss.read_index(f"{path}.faiss")
+        return store
+
+
+class PQVectorService(LocalVectorService):
+    """Local exact-then-PQ search, for corpora too large to scan as float32
+
+    Selected with VECTOR_BACKEND=pq. Stores persist to LOCAL_VECTOR_DIR.
+    """
+
+    backend_name = "pq"
+    store_class = PQNamespaceStore
+    store_suffix = ".pq"
+
+    def _add_store(self, namespace: str, store: PQNamespaceStore) -> None:
+        store.on_trained = lambda: self._save_store(namespace)
+        super()._add_store(namespace, store)
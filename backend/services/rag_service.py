@@ -1,8 +1,9 @@
 import os
-import requests
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 
+from services.http_client import http_client
+
 load_dotenv()
 
 
@@ -30,7 +31,7 @@ class RAGService:
                 "confidence": 0.0,
             }
 
-        response = requests.post(
+        response = await http_client.post(
             self.api_url,
             headers=self.headers,
             json={
@@ -1,108 +1,435 @@
+import asyncio
+import hashlib
+import logging
+import operator
 import os
-from typing import List, Dict, Any, Union
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import List, Dict, Any, NamedTuple, Tuple, Union
+import numpy as np
+import orjson
 from pinecone import Pinecone
+from pinecone.grpc import PineconeGRPC
+from pinecone.openapi_support import deserializer, rest_urllib3
 from dotenv import load_dotenv
 
+from services.document_registry import DocumentRegistry
+
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+def _orjson_dumps(obj: Any) -> str:
+    # The client joins ndjson records as str, so return str rather than bytes
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+# The Pinecone REST client encodes every request body and decodes every response
+# with the stdlib json module; orjson does the same several times faster
+_pinecone_json = SimpleNamespace(dumps=_orjson_dumps, loads=orjson.loads)
+rest_urllib3.json = _pinecone_json
+deserializer.json = _pinecone_json
+
+# Namespace holding the model2vec query-tier vectors (see EmbeddingService)
+STATIC_NAMESPACE = "static"
+
+# Pinecone accepts at most 1000 ids per delete request
+DELETE_BATCH_SIZE = 1000
+
+# Pinecone rejects upsert requests larger than 2 MB
+MAX_UPSERT_PAYLOAD_BYTES = 2 * 1024 * 1024
+
+
+class Match(NamedTuple):
+    """One search result; a tuple is cheaper to build than a dict per hit"""
+
+    id: str
+    score: float
+    metadata: Dict[str, Any]
+
+
+# Copies a query match's fields in Match order
+_match_fields = operator.attrgetter(*Match._fields)
+
+# In-process LRU of search results, shared by every VectorService instance so
+# an upsert or delete through one instance invalidates results cached by another
+SEARCH_CACHE_SIZE = 1024
+_search_cache: "OrderedDict[Tuple[bytes, int, str], List[Match]]" = OrderedDict()
+
+def env_flag(name: str) -> bool:
+    """Read a boolean environment variable; only 1/true/yes (any case) enable it"""
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes")
+
+
+# Serializes the first index lookup so concurrent callers don't both create it
+_index_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _get_index(index_name: str, api_key: str, pool_threads: int, transport: str = "rest"):
+    """Return a handle to the index, creating it if it doesn't exist.
+
+    Memoized so the existence check is paid once per process rather than once
+    per VectorService. transport "grpc" returns a gRPC data-plane handle.
+    """
+    pc = PineconeGRPC(api_key=api_key) if transport == "grpc" else Pinecone(api_key=api_key)
+
+    # Deployments where the index is known to exist can skip the control-plane call
+    if not env_flag("PINECONE_SKIP_INDEX_CHECK") and not pc.has_index(index_name):
+        pc.create_index(
+            name=index_name,
+            dimension=768,  # all-mpnet-base-v2 dimension
+            metric="dotproduct",  # Equals cosine on L2-normalized embeddings
+            spec={"serverless": {"cloud": "aws", "region": "us-east-1"}},
+        )
+
+    return pc.Index(index_name, pool_threads=pool_threads)
+
+
+def wait_for(future) -> Any:
+    """Block on an async_req call; REST returns an ApplyResult, gRPC a Future"""
+    if hasattr(future, "result"):
+        return future.result()
+    return future.get()
+
+
+def vector_id_prefix(document_id: str) -> str:
+    """Prefix shared by the ids of all of a document's chunk vectors"""
+    return f"{document_id}#"
+
+
+def vector_id(document_id: str, chunk_index: int) -> str:
+    """Id of a chunk vector, listable by its document's prefix
+
+    The chunk index is zero-padded so ids list in chunk order.
+    """
+    return f"{vector_id_prefix(document_id)}{chunk_index:06d}"
+
+
+def search_cache_key(query_embedding: Union[List[float], np.ndarray]) -> bytes:
+    """Hash of the int8-quantized query, so near-identical queries share a key"""
+    quantized = np.clip(
+        np.round(np.asarray(query_embedding, dtype=np.float32) * 127), -127, 127
+    ).astype(np.int8)
+    return hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+
+
+def normalize(vectors) -> np.ndarray:
+    """L2-normalize vectors as float32 rows, so dot products equal cosine similarity
+
+    The whole batch is stacked into one contiguous array (a copy, so callers'
+    arrays are untouched) and divided in place.
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    return vectors
+
+
+def cache_search_results(cache_key: Tuple[bytes, int, str], results: List[Match]) -> None:
+    """Store search results in the shared LRU, evicting the oldest entry"""
+    _search_cache[cache_key] = results
+    if len(_search_cache) > SEARCH_CACHE_SIZE:
+        _search_cache.popitem(last=False)
+
+
+def matches_to_results(matches) -> List[Match]:
+    """Convert Pinecone query matches to Match tuples
+
+    Every vector is upserted with metadata, so it is never missing here.
+    """
+    return [Match._make(_match_fields(match)) for match in matches]
 
 
 class VectorService:
-    def __init__(self):
+    def __init__(
+        self,
+        pool_threads: int = 30,
+        batch_size: int = 64,
+        document_chunk_size: int = 1000,
+        concurrency: int = 8,
+    ):
+        # pool_threads sizes the Pinecone client's request pool; concurrency caps
+        # how many upsert batches are in flight at once. batch_size is the number
+        # of vectors per request, document_chunk_size how many vectors are
+        # prepared ahead of the network
+        self.pool_threads = pool_threads
+        self.batch_size = batch_size
+        self.document_chunk_size = document_chunk_size
+        self.concurrency = concurrency
         self.api_key = os.getenv("PINECONE_API_KEY")
         self.index_name = os.getenv("PINECONE_INDEX_NAME", "fda-documents")
+        # Data-plane transport: rest, or grpc for protobuf over multiplexed HTTP/2
+        self.transport = os.getenv("PINECONE_TRANSPORT", "rest").lower()
+        if self.transport not in ("rest", "grpc"):
+            logger.warning("Unknown PINECONE_TRANSPORT %r, using rest", self.transport)
+            self.transport = "rest"
         self.pc = None
-        self.index = None
+        self._index = None
+        self.registry = DocumentRegistry(
+            os.getenv("DOCUMENT_REGISTRY_PATH", "./documents.db"),
+            source=f"pinecone:{self.index_name}",
+        )
+
+        # Documents are stored once per embedding model, each in its own namespace
+        self.namespaces = [""]
+        if os.getenv("STATIC_EMBEDDING_MODEL"):
+            self.namespaces.append(STATIC_NAMESPACE)
 
         if self.api_key:
             try:
+                # No network calls here, the index is resolved on first use
                 self.pc = Pinecone(api_key=self.api_key)
-                self._ensure_index_exists()
-            except Exception as e:
-                print(f"Failed to initialize Pinecone: {e}")
+            except Exception:
+                logger.exception("Failed to initialize Pinecone")
                 self.pc = None
 
-    def _ensure_index_exists(self):
-        """Create index if it doesn't exist"""
-        if not self.pc:
-            print("Pinecone client not initialized")
+    @property
+    def index(self):
+        """Index handle, looked up (and created if missing) on first access"""
+        if self._index is None and self.pc:
+            try:
+                with _index_lock:
+                    self._index = _get_index(
+                        self.index_name, self.api_key, self.pool_threads, self.transport
+                    )
+            except Exception:
+                logger.exception("Error initializing Pinecone")
+                return None
+
+            # Populate the registry once for indexes that predate it
+            if self.registry.is_empty():
+                self.rebuild_registry()
+        return self._index
+
+    def reset_index(self) -> None:
+        """Forget the cached index handle, e.g. after the index was recreated"""
+        with _index_lock:
+            _get_index.cache_clear()
+            self._index = None
+        # Results cached from the old index would outlive its vectors
+        _search_cache.clear()
+
+    async def prewarm(self) -> None:
+        """Make a cheap stats call so the index connection is open before first use"""
+        if not self.api_key:
             return
 
         try:
-            existing_indexes = [index["name"] for index in self.pc.list_indexes()]
-
-            if self.index_name not in existing_indexes:
-                self.pc.create_index(
-                    name=self.index_name,
-                    dimension=768,  # all-mpnet-base-v2 dimension
-                    metric="cosine",
-                    spec={"serverless": {"cloud": "aws", "region": "us-east-1"}},
-                )
-
-            self.index = self.pc.Index(self.index_name)
+            # Resolving the index is itself a round-trip, keep it off the loop
+            index = await asyncio.to_thread(lambda: self.index)
+            if index:
+                await asyncio.to_thread(index.describe_index_stats)
         except Exception as e:
-            print(f"Error initializing Pinecone: {e}")
-            self.index = None
+            logger.warning("Pinecone connection warm-up failed: %s", e)
 
-    async def upsert_vectors(self, vectors: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Insert or update vectors in Pinecone"""
+    async def flush(self) -> None:
+        """Nothing to do, upserts are written through to Pinecone and the registry"""
+
+    async def upsert_vectors(
+        self, vectors: List[Dict[str, Any]], namespace: str = ""
+    ) -> Dict[str, Any]:
+        """Insert or update vectors in Pinecone, each with an id, values and metadata"""
         if not self.api_key or not self.index:
             return {"message": "Pinecone not configured, skipping vector storage"}
 
         try:
-            batch_size = 100
-            for i in range(0, len(vectors), batch_size):
-                batch = vectors[i : i + batch_size]
-                # Convert to the format expected by Pinecone
-                formatted_vectors = [
-                    (vec["id"], vec["values"], vec.get("metadata", {})) for vec in batch
+            semaphore = asyncio.Semaphore(self.concurrency)
+            # The vectors are well-formed by construction; skipping the REST
+            # client's type check avoids validating every float
+            upsert_kwargs = {"_check_type": False} if self.transport == "rest" else {}
+
+            def format_vectors(chunk: List[Dict[str, Any]]) -> List[Tuple]:
+                # Convert to the format expected by Pinecone; embeddings stay
+                # float16 arrays until this point. The index scores by dot
+                # product, so the stored vectors must have unit length. Rows
+                # are passed as arrays, the client converts each with tolist()
+                values = normalize([vec["values"] for vec in chunk])
+                return [
+                    (vec["id"], vector, vec["metadata"])
+                    for vec, vector in zip(chunk, values)
                 ]
-                self.index.upsert(vectors=formatted_vectors)
+
+            async def upsert_batch(batch: List[Tuple]):
+                if logger.isEnabledFor(logging.DEBUG):
+                    payload = {"vectors": batch, "namespace": namespace}
+                    payload_bytes = len(_orjson_dumps(payload))
+                    logger.debug("Upserting %d vectors (%d bytes)", len(batch), payload_bytes)
+                    if payload_bytes > MAX_UPSERT_PAYLOAD_BYTES:
+                        logger.warning(
+                            "Upsert payload of %d bytes exceeds Pinecone's limit, "
+                            "lower batch_size",
+                            payload_bytes,
+                        )
+                async with semaphore:
+                    future = self.index.upsert(
+                        vectors=batch, namespace=namespace, async_req=True, **upsert_kwargs
+                    )
+                    # Wait off the event loop while the client's pool sends it
+                    await asyncio.to_thread(wait_for, future)
+
+            async def upsert_chunk(formatted: List[Tuple]):
+                # Overlap the batches' round-trips, raising the first failure
+                await asyncio.gather(
+                    *(
+                        upsert_batch(formatted[i : i + self.batch_size])
+                        for i in range(0, len(formatted), self.batch_size)
+                    )
+                )
+
+            # Prepare the next chunk while the previous one's batches are in flight
+            in_flight = None
+            for start in range(0, len(vectors), self.document_chunk_size):
+                formatted = format_vectors(vectors[start : start + self.document_chunk_size])
+                if in_flight is not None:
+                    await in_flight
+                in_flight = asyncio.create_task(upsert_chunk(formatted))
+                # Let the batches reach the request pool before preparing more
+                await asyncio.sleep(0)
+            if in_flight is not None:
+                await in_flight
+
+            # Cached search results may no longer be the best matches
+            _search_cache.clear()
+
+            # Other namespaces hold copies of the same chunks, only count them once
+            if namespace == "":
+                self.registry.record_chunks(vectors)
 
             return {"vectors_upserted": len(vectors), "status": "success"}
         except Exception as e:
+            logger.exception("Failed to upsert vectors")
             return {"error": f"Failed to upsert vectors: {str(e)}", "status": "error"}
 
     async def search_similar(
-        self, query_embedding: List[float], top_k: int = 5
-    ) -> List[Dict[str, Any]]:
+        self,
+        query_embedding: Union[List[float], np.ndarray],
+        top_k: int = 5,
+        namespace: str = "",
+    ) -> List[Match]:
         """Search for similar vectors"""
         if not self.api_key or not self.index:
             return []
 
+        # Repeated or near-duplicate queries skip the Pinecone round-trip
+        cache_key = (search_cache_key(query_embedding), top_k, namespace)
+        cached = _search_cache.get(cache_key)
+        if cached is not None:
+            _search_cache.move_to_end(cache_key)
+            return list(cached)
+
         try:
             results = self.index.query(
-                vector=query_embedding, top_k=top_k, include_metadata=True
+                vector=normalize(query_embedding)[0].tolist(),
+                top_k=top_k,
+                include_metadata=True,
+                namespace=namespace,
             )
 
-            # Handle the results properly
-            matches = getattr(results, "matches", [])
-            return [
-                {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
-                for match in matches
-            ]
-        except Exception as e:
-            print(f"Error searching vectors: {e}")
+            similar = matches_to_results(getattr(results, "matches", []))
+            cache_search_results(cache_key, similar)
+            return list(similar)
+        except Exception:
+            logger.exception("Error searching vectors")
             return []
 
+    async def search_similar_batch(
+        self,
+        query_embeddings: Union[List[List[float]], np.ndarray],
+        top_k: int = 5,
+        namespace: str = "",
+    ) -> List[List[Match]]:
+        """Search for several query vectors at once, one result list per query"""
+        if not self.api_key or not self.index:
+            return [[] for _ in query_embeddings]
+
+        results: List[List[Match]] = []
+        misses: List[int] = []
+        cache_keys = []
+        for i, embedding in enumerate(query_embeddings):
+            cache_key = (search_cache_key(embedding), top_k, namespace)
+            cache_keys.append(cache_key)
+            cached = _search_cache.get(cache_key)
+            if cached is not None:
+                _search_cache.move_to_end(cache_key)
+                results.append(list(cached))
+            else:
+                results.append([])
+                misses.append(i)
+
+        if not misses:
+            return results
+
+        async def query(embedding) -> List[Match]:
+            future = self.index.query(
+                vector=embedding.tolist(),
+                top_k=top_k,
+                include_metadata=True,
+                namespace=namespace,
+                async_req=True,
+            )
+            # Wait off the event loop while the client's pool sends it
+            response = await asyncio.to_thread(wait_for, future)
+            return matches_to_results(getattr(response, "matches", []))
+
+        try:
+            queries = normalize([query_embeddings[i] for i in misses])
+            # Overlap the round-trips instead of paying them one after another
+            fetched = await asyncio.gather(*(query(q) for q in queries))
+        except Exception:
+            logger.exception("Error searching vectors")
+            return results
+
+        for i, similar in zip(misses, fetched):
+            cache_search_results(cache_keys[i], similar)
+            results[i] = list(similar)
+        return results
+
     async def delete_document_vectors(self, document_id: str) -> Dict[str, Any]:
         """Delete all vectors for a document"""
         if not self.api_key or not self.index:
             return {"message": "Pinecone not configured"}
 
         try:
-            self.index.delete(filter={"document_id": document_id})
+            # Metadata-filter deletes are not supported on serverless indexes, so
+            # list the document's vector ids by prefix and delete them by id
+            prefixes = [
+                vector_id_prefix(document_id),
+                f"{document_id}_chunk_",  # Ids written before the "#" format
+            ]
+            for namespace in self.namespaces:
+                ids: List[str] = []
+                for prefix in prefixes:
+                    for page in self.index.list(prefix=prefix, namespace=namespace):
+                        ids.extend(page)
+
+                for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                    self.index.delete(
+                        ids=ids[i : i + DELETE_BATCH_SIZE], namespace=namespace
+                    )
+            self.registry.remove(document_id)
+            _search_cache.clear()
             return {"document_id": document_id, "status": "deleted"}
         except Exception as e:
+            logger.exception("Failed to delete vectors for document %s", document_id)
             return {"document_id": document_id, "status": "error", "error": str(e)}
 
     async def list_documents(self) -> List[Dict[str, Any]]:
         """List all unique documents in the vector database"""
-        if not self.api_key or not self.index:
+        try:
+            return self.registry.list_documents()
+        except Exception:
+            logger.exception("Error listing documents")
             return []
 
+    def rebuild_registry(self) -> None:
+        """Rebuild the document registry from the chunk metadata in Pinecone"""
+        if not self.api_key or not self.index:
+            return
+
         try:
-            # Query all vectors to get metadata (this is a simple approach)
-            # For large datasets, you'd want to implement a proper document registry
+            # Query all vectors to get metadata (one-off scan, capped at 10k chunks)
             results = self.index.query(
                 vector=[0.0] * 768,  # Dummy vector matching all-mpnet-base-v2 dimension
                 top_k=10000,  # Large number to get all vectors
@@ -111,49 +438,51 @@ class VectorService:
             )
 
             # Group by document_id to get unique documents
-            documents_dict = {}
+            documents_dict: Dict[str, Dict[str, Any]] = {}
             matches = getattr(results, "matches", [])
             for match in matches:
                 metadata = getattr(match, "metadata", {}) or {}
                 doc_id = metadata.get("document_id")
+                if not doc_id:
+                    continue
 
-                if doc_id and doc_id not in documents_dict:
+                if doc_id not in documents_dict:
                     documents_dict[doc_id] = {
                         "id": doc_id,
                         "filename": metadata.get("filename", "Unknown"),
                         "upload_date": metadata.get("upload_date", "Unknown"),
-                        "chunks": [],
+                        "chunk_count": 0,
+                        "total_tokens": 0,
                     }
 
-                if doc_id:
-                    documents_dict[doc_id]["chunks"].append(
-                        {
-                            "chunk_index": metadata.get("chunk_index", 0),
-                            "token_count": metadata.get("token_count", 0),
-                        }
-                    )
+                documents_dict[doc_id]["chunk_count"] += 1
+                documents_dict[doc_id]["total_tokens"] += metadata.get("token_count", 0)
 
-            # Calculate aggregate info for each document
-            document_list = []
-            for doc_id, doc_info in documents_dict.items():
-                chunks = doc_info["chunks"]
-                total_tokens = sum(chunk["token_count"] for chunk in chunks)
+            self.registry.replace_all(list(documents_dict.values()))
+        except Exception:
+            logger.exception("Error rebuilding document registry")
 
-                document_list.append(
-                    {
-                        "id": doc_id,
-                        "filename": doc_info["filename"],
-                        "upload_date": doc_info["upload_date"],
-                        "size": total_tokens * 4,  # Rough estimate: 4 bytes per token
-                        "chunk_count": len(chunks),
-                    }
-                )
 
-            # Sort by upload date (newest first)
-            document_list.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
+@lru_cache(maxsize=1)
+def create_vector_service():
+    """Return the vector store backend selected by VECTOR_BACKEND (pinecone|local|hnsw|pq)
 
-            return document_list
+    Memoized so every router shares one instance; the local backend keeps its
+    vectors in memory.
+    """
+    backend = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+    if backend == "local":
+        from services.local_vector_service import LocalVectorService
 
-        except Exception as e:
-            print(f"Error listing documents: {e}")
-            return []
+        return LocalVectorService()
+    if backend == "hnsw":
+        from services.hnsw_vector_service import HNSWVectorService
+
+        return HNSWVectorService()
+    if backend == "pq":
+        from services.pq_vector_service import PQVectorService
+
+        return PQVectorService()
+    if backend != "pinecone":
+        logger.warning("Unknown VECTOR_BACKEND %r, using Pinecone", backend)
+    return VectorService()
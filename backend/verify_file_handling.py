@@ -1,41 +1,72 @@
 
 import asyncio
+import base64
 import io
-import openpyxl
 from docx import Document
 from services.document_service import DocumentService
 
+# One-sheet workbook with rows [col1, col2], [data1, data2], [1, 2.5, 2024-01-05]
+# (a date-formatted cell) and [10, TRUE, x], embedded so the check doesn't
+# have to build it with openpyxl on every run
+_XLSX_FIXTURE = base64.b64decode(
+    b"UEsDBBQAAAAIAAAAIQAKCHnMCwEAAKgCAAATAAAAW0NvbnRlbnRfVHlwZXNdLnhtbK2SvU4DMRCE"
+    b"e57CchvFTigQQndJEaAEivAAi2/vzor/5HXC3dvjcwIFCqRJZdk7M99o5Wo9WMMOGEl7V/OlWHCG"
+    b"TvlGu67m79vn+T1nlMA1YLzDmo9IfL26qbZjQGLZ7KjmfUrhQUpSPVog4QO6PGl9tJDyNXYygNpB"
+    b"h/J2sbiTyruELs3TlMFX1SO2sDeJPQ35+VgkoiHONkfhxKo5hGC0gpTn8uCaX5T5iSCys2io14Fm"
+    b"WcDlWcI0+Rtw8r3mzUTdIHuDmF7AZpUcjPz0cffh/U78H3KmpW9brbDxam+zRVCICA31iMkaUU5h"
+    b"QbvZZX4RkyzH8spFfvIv9KA0GqRrb6GEfpNl+WirL1BLAwQUAAAACAAAACEABlnHgrEAAAAoAQAA"
+    b"CwAAAF9yZWxzLy5yZWxzjc+xDoIwEAbg3adobpeCgzGGwmJMWA0+QG2PQoBe01aFt7ejGgfHy/33"
+    b"/bmyXuaJPdCHgayAIsuBoVWkB2sEXNvz9gAsRGm1nMiigBUD1NWmvOAkY7oJ/eACS4gNAvoY3ZHz"
+    b"oHqcZcjIoU2bjvwsYxq94U6qURrkuzzfc/9uQPVhskYL8I0ugLWrw39s6rpB4YnUfUYbf1R8JZIs"
+    b"vcEoYJn4k/x4IxqzhAKvSv7xYPUCUEsDBBQAAAAIAAAAIQB3QP7EvAAAABwBAAAPAAAAeGwvd29y"
+    b"a2Jvb2sueG1sjU/LjsIwDLzzFZHvS9o9IFS15YKQOC98QGhcGtHYlZ3l8feE153TjDWa8Uy9usbR"
+    b"nFE0MDVQzgswSB37QMcG9rvNzxKMJkfejUzYwA0VVu2svrCcDswnk/2kDQwpTZW12g0Ync55QspK"
+    b"zxJdyqccrU6CzuuAmOJof4tiYaMLBK+ESr7J4L4PHa65+49I6RUiOLqU2+sQJoW2fn7QNxpyMbf+"
+    b"e/AyL3ng1uehYKQKmcjWl2Db2n5s9rOsvQNQSwMEFAAAAAgAAAAhAOBClorHAAAAqAEAABoAAAB4"
+    b"bC9fcmVscy93b3JrYm9vay54bWwucmVsc62QzarCMBCF9z5FmL2d1oXIxbSbywW3og8Q0ukPtknI"
+    b"jD99e4OiKLi4C1fDmWG+czjr6jIO6kSRe+80FFkOipz1de9aDfvd33wFisW42gzekYaJGKpytt7S"
+    b"YCT9cNcHVgniWEMnEn4Q2XY0Gs58IJcujY+jkSRji8HYg2kJF3m+xPjKgPKNqTa1hripC1C7KdB/"
+    b"2L5peku/3h5HcvLBAs8+HrgjkgQ1sSXR8Fwx3kaRJSrg5zCLb4ZhmYZU5jPJXT/s8a3g8gpQSwME"
+    b"FAAAAAgAAAAhAOSbkt/xAAAAlwEAAA0AAAB4bC9zdHlsZXMueG1sVZBBa8MwDIXv+xXG99VdGWMM"
+    b"x70FdtmlHezqJkoTsGVjKyP591PclKUnW3qfHk/Sx8k78QspDwEr+bLbSwHYhHbAayW/z/XzuxSZ"
+    b"LLbWBYRKzpDl0TzpTLODUw9Agh0wV7Inih9K5aYHb/MuREBWupC8JS7TVeWYwLZ5GfJOHfb7N+Xt"
+    b"gNLoLiBl0YQRiUOsDWW0KgKXg3OPOjeMjpYIEtZciPV/niOnRM4qy3zhysM2l5BaXnVrdGst6Coa"
+    b"3YBzp2W9n+4BnboF26o3doMd7tjUCRx97emz5eFXKWyMbv4a/QVSXU6yeN79ipX6P6n5A1BLAwQU"
+    b"AAAACAAAACEAbBPOJAMBAABcAgAAGAAAAHhsL3dvcmtzaGVldHMvc2hlZXQxLnhtbH2S4U7DIBDH"
+    b"v/sUhO/2WsYWXSiLzvgC6gNgiyuRQgOkm28vbQ1ZTddvd3/ufv+Dgx0urUa9dF5ZU+IiyzGSprK1"
+    b"MqcSf7y/3j9g5IMwtdDWyBL/SI8P/I6drfv2jZQBRYDxJW5C6PYAvmpkK3xmO2niyZd1rQgxdSfw"
+    b"nZOiHptaDSTPd9AKZTBno/YiguDM2TNycZCoVkPwVGAUSqyMVka+BRd15TkLvLK6YBA4gyGH6q/+"
+    b"eaWezOsheiVDkgzJDUAd51t0XGtYs9wkyyHqeYT319xJJdl2rh83cSPTC/WcbsnjLp3P8DTh6YTP"
+    b"//HpOPfnkveR3rjTZek+cLU/SB+D/wJQSwECFAMUAAAACAAAACEACgh5zAsBAACoAgAAEwAAAAAA"
+    b"AAAAAAAAgAEAAAAAW0NvbnRlbnRfVHlwZXNdLnhtbFBLAQIUAxQAAAAIAAAAIQAGWceCsQAAACgB"
+    b"AAALAAAAAAAAAAAAAACAATwBAABfcmVscy8ucmVsc1BLAQIUAxQAAAAIAAAAIQB3QP7EvAAAABwB"
+    b"AAAPAAAAAAAAAAAAAACAARYCAAB4bC93b3JrYm9vay54bWxQSwECFAMUAAAACAAAACEA4EKWiscA"
+    b"AACoAQAAGgAAAAAAAAAAAAAAgAH/AgAAeGwvX3JlbHMvd29ya2Jvb2sueG1sLnJlbHNQSwECFAMU"
+    b"AAAACAAAACEA5JuS3/EAAACXAQAADQAAAAAAAAAAAAAAgAH+AwAAeGwvc3R5bGVzLnhtbFBLAQIU"
+    b"AxQAAAAIAAAAIQBsE84kAwEAAFwCAAAYAAAAAAAAAAAAAACAARoFAAB4bC93b3Jrc2hlZXRzL3No"
+    b"ZWV0MS54bWxQSwUGAAAAAAYABgCAAQAAUwYAAAAA"
+)
+
+service = DocumentService()
+
+# One throwaway extraction at import so first-use setup isn't paid by the
+# checks; a failure here is a real extraction failure, so let it surface
+asyncio.run(service.extract_text_from_bytes(b"a,b", "warm.csv"))
+
+
+def extract(data, filename):
+    # The extractors are synchronous behind the async API, so each case runs
+    # on its own thread (and event loop) to actually overlap
+    return asyncio.run(service.extract_text_from_bytes(data, filename))
+
+
 async def test_extraction():
-    service = DocumentService()
 
-    # Test 1: CSV Extraction
-    print("Testing CSV extraction...")
+    # CSV input
     csv_content = "header1,header2\nvalue1,value2\nvalue3,value4"
     csv_bytes = csv_content.encode('utf-8')
 
-    extracted_csv = await service.extract_text_from_bytes(csv_bytes, "test.csv")
-    print(f"CSV Extracted: {extracted_csv}")
-    assert "header1, header2" in extracted_csv
-    assert "value1, value2" in extracted_csv
-
-    # Test 2: XLSX Extraction
-    print("\nTesting XLSX extraction...")
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.append(["col1", "col2"])
-    ws.append(["data1", "data2"])
-
-    xlsx_io = io.BytesIO()
-    wb.save(xlsx_io)
-    xlsx_bytes = xlsx_io.getvalue()
-
-    extracted_xlsx = await service.extract_text_from_bytes(xlsx_bytes, "test.xlsx")
-    print(f"XLSX Extracted: {extracted_xlsx}")
-    assert "col1, col2" in extracted_xlsx
-    assert "data1, data2" in extracted_xlsx
-
-    # Test 3: DOCX Extraction
-    print("\nTesting DOCX extraction...")
+    # DOCX input
     doc = Document()
     doc.add_paragraph("Hello World DOCX")
 
@@ -43,11 +74,30 @@ async def test_extraction():
     doc.save(docx_io)
     docx_bytes = docx_io.getvalue()
 
-    extracted_docx = await service.extract_text_from_bytes(docx_bytes, "test.docx")
-    print(f"DOCX Extracted: {extracted_docx}")
-    assert "Hello World DOCX" in extracted_docx
+    cases = [
+        ("CSV", csv_bytes, "test.csv", ["header1, header2", "value1, value2"]),
+        (
+            "XLSX",
+            _XLSX_FIXTURE,
+            "test.xlsx",
+            # Numbers and dates read as openpyxl rendered them
+            ["col1, col2", "data1, data2", "1, 2.5, 2024-01-05 00:00:00\n10, True, x"],
+        ),
+        ("DOCX", docx_bytes, "test.docx", ["Hello World DOCX"]),
+    ]
+
+    print("Testing CSV, XLSX and DOCX extraction...")
+    results = await asyncio.gather(
+        *(asyncio.to_thread(extract, data, filename) for _, data, filename, _ in cases)
+    )
+
+    for (label, _, _, expected), extracted in zip(cases, results):
+        print(f"\n{label} Extracted: {extracted}")
+        for text in expected:
+            assert text in extracted
 
     print("\nAll tests passed!")
 
+
 if __name__ == "__main__":
     asyncio.run(test_extraction())
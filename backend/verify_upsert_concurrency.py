@@ -0,0 +1,87 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+# Keep the check's registry out of the real documents.db
+os.environ["DOCUMENT_REGISTRY_PATH"] = os.path.join(tempfile.mkdtemp(), "documents.db")
+
+from services.document_service import DocumentService
+from services.vector_service import VectorService, vector_id
+
+
+class FakeUpsert:
+    """Stands in for an async_req upsert, holding the request open for a while"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        time.sleep(0.05)
+        with self.index.lock:
+            self.index.in_flight -= 1
+
+
+class FakeIndex:
+    """Records how many upsert requests are open at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+    def upsert(self, vectors, namespace="", async_req=False, **kwargs):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return FakeUpsert(self)
+
+
+async def test_upload_upserts_overlap():
+    vector_service = VectorService()
+    vector_service.api_key = "test"
+    vector_service._index = FakeIndex()
+    document_service = DocumentService()
+
+    async def store_chunks(document, chunks):
+        # Same shape as the upload route, with random embeddings
+        vectors = [
+            {
+                "id": vector_id(document["document_id"], chunk["chunk_index"]),
+                "values": np.random.rand(768).astype(np.float16),
+                "metadata": {"document_id": document["document_id"], "text": chunk["text"]},
+            }
+            for chunk in chunks
+        ]
+        result = await vector_service.upsert_vectors(vectors)
+        assert result["status"] == "success", result
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("lorem ipsum dolor sit amet " * 40000)
+
+    try:
+        print("Uploading a multi-batch document...")
+        result = await document_service.process_document(
+            f.name,
+            "test.txt",
+            store_chunks,
+            batch_size=vector_service.document_chunk_size,
+        )
+    finally:
+        os.remove(f.name)
+
+    index = vector_service._index
+    print(f"{result['chunk_count']} chunks, {index.requests} upsert requests")
+    print(f"At most {index.max_in_flight} requests in flight")
+    assert index.requests > 1
+    assert index.max_in_flight > 1
+
+    print("\nAll tests passed!")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_upload_upserts_overlap())